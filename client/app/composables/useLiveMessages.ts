@@ -0,0 +1,35 @@
+import { useQueryClient } from "@tanstack/vue-query";
+import type { Ref } from "vue";
+
+// Refetch message queries when the server pushes new traffic, instead of polling
+export function useLiveMessages(phoneNumber?: Ref<string | undefined>) {
+	const config = useRuntimeConfig();
+	const queryClient = useQueryClient();
+	let source: EventSource | undefined;
+
+	// Bursts of statuses collapse into one refetch
+	const refresh = useDebounceFn(
+		() => queryClient.invalidateQueries({ queryKey: ["messages"] }),
+		500
+	);
+
+	function connect() {
+		source?.close();
+
+		const url = new URL(`${config.public.apiBase}/events`);
+		if (phoneNumber?.value) {
+			url.searchParams.set("phone_number", phoneNumber.value);
+		}
+
+		source = new EventSource(url);
+		for (const event of ["message", "status", "resync"]) {
+			source.addEventListener(event, refresh);
+		}
+	}
+
+	onMounted(connect);
+	if (phoneNumber) {
+		watch(phoneNumber, connect);
+	}
+	onBeforeUnmount(() => source?.close());
+}
@@ -4,6 +4,7 @@ export interface IncomingMessage {
 	type: "message";
 	from_number: string;
 	incoming_message: string;
+	message_id?: string | null;
 }
 
 export interface ReplyMessage {
@@ -19,6 +20,7 @@ export interface StatusUpdate {
 	status: string;
 	message_id: string;
 	recipient_id: string;
+	errors?: Record<string, unknown>[] | null;
 }
 
 export interface MessageWithStatusResponse {
@@ -5,4 +5,6 @@ export interface PaginatedResponse<T>  {
   page: number;
   size: number;
   pages: number;
+  next_cursor?: string | null;
+  prev_cursor?: string | null;
 };
@@ -1 +1,6 @@
 """Chatbot package."""
+
+import time
+
+# Reference point for the boot report in server.startup
+IMPORT_STARTED = time.perf_counter()
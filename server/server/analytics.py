@@ -0,0 +1,171 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Literal
+from zoneinfo import ZoneInfo
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.buffer import write_buffer
+from server.logger import logger
+from server.settings import settings
+
+ROLLUPS_COLLECTION = "stats_rollups"
+
+Period = Literal["day", "month"]
+PERIOD_FORMATS: dict[Period, str] = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+COUNTERS = (
+    "inbound",
+    "outbound",
+    "delivered",
+    "read",
+    "failed",
+    "llm_calls",
+    "llm_seconds",
+    "llm_tokens",
+)
+
+ROLLUP_INDEXES = [
+    IndexModel(
+        [("period", ASCENDING), ("bucket", ASCENDING), ("phone_number_id", ASCENDING)],
+        name="period_bucket",
+    ),
+]
+
+_timezone = ZoneInfo(settings.stats_timezone)
+
+
+def buckets(timestamp: int) -> dict[Period, str]:
+    """
+    Day and month a unix timestamp falls in, in the business timezone.
+    """
+    moment = datetime.fromtimestamp(timestamp, _timezone)
+    return {period: moment.strftime(fmt) for period, fmt in PERIOD_FORMATS.items()}
+
+
+def rollup_operations(
+    timestamp: int, phone_number_id: str, increments: dict[str, float]
+) -> list[UpdateOne]:
+    return [
+        UpdateOne(
+            {"_id": f"{period}:{bucket}:{phone_number_id}"},
+            {
+                "$inc": increments,
+                "$setOnInsert": {
+                    "period": period,
+                    "bucket": bucket,
+                    "phone_number_id": phone_number_id,
+                },
+            },
+            upsert=True,
+        )
+        for period, bucket in buckets(timestamp).items()
+    ]
+
+
+async def record(timestamp: int, phone_number_id: str, **increments: float) -> None:
+    """
+    Adds to the day and month rollups, batched through the write buffer.
+    """
+    for operation in rollup_operations(timestamp, phone_number_id, increments):
+        await write_buffer.add(ROLLUPS_COLLECTION, operation)
+
+
+async def ensure_indexes(database: AsyncDatabase) -> None:
+    await database.get_collection(ROLLUPS_COLLECTION).create_indexes(ROLLUP_INDEXES)
+
+
+async def query_stats(
+    database: AsyncDatabase,
+    period: Period,
+    start: str | None,
+    end: str | None,
+    phone_number_id: str | None,
+) -> list[dict]:
+    query: dict = {"period": period}
+    if start or end:
+        query["bucket"] = {}
+        if start:
+            query["bucket"]["$gte"] = start
+        if end:
+            query["bucket"]["$lte"] = end
+    if phone_number_id:
+        query["phone_number_id"] = phone_number_id
+
+    docs = (
+        await database.get_collection(ROLLUPS_COLLECTION)
+        .find(query, {"_id": 0})
+        .sort([("bucket", ASCENDING), ("phone_number_id", ASCENDING)])
+        .to_list()
+    )
+    for doc in docs:
+        for counter in COUNTERS:
+            doc.setdefault(counter, 0)
+    return docs
+
+
+async def rebuild_rollups(database: AsyncDatabase) -> None:
+    """
+    Recomputes every rollup from the messages collection (one pass).
+    LLM figures are only available for messages stored with `llm` info.
+    """
+    totals: defaultdict[str, defaultdict[str, float]] = defaultdict(
+        lambda: defaultdict(float)
+    )
+    keys: dict[str, dict] = {}
+
+    def add(timestamp: int, phone_number_id: str, **increments: float) -> None:
+        for period, bucket in buckets(timestamp).items():
+            key = f"{period}:{bucket}:{phone_number_id}"
+            keys[key] = {
+                "period": period,
+                "bucket": bucket,
+                "phone_number_id": phone_number_id,
+            }
+            for name, value in increments.items():
+                totals[key][name] += value
+
+    async for doc in database.get_collection("messages").find(
+        {"timestamp": {"$exists": True}},
+        {
+            "timestamp": 1,
+            "phone_number_id": 1,
+            "reply_id": 1,
+            "llm": 1,
+            "status_summary.timestamps": 1,
+            # Enough to count them without loading the raw messages
+            "fragments.id": 1,
+        },
+    ):
+        phone_number_id = doc["phone_number_id"]
+        # Coalesced turns count every fragment, as at ingest
+        inbound = len(doc.get("fragments") or [None])
+        add(doc["timestamp"], phone_number_id, inbound=inbound)
+
+        llm = doc.get("llm") or {}
+        if llm.get("source") == "llm":
+            add(
+                doc["timestamp"],
+                phone_number_id,
+                llm_calls=1,
+                llm_seconds=llm.get("latency", 0.0),
+                llm_tokens=llm.get("tokens", 0),
+            )
+
+        if doc.get("reply_id"):
+            add(doc["timestamp"], phone_number_id, outbound=1)
+
+        timestamps = (doc.get("status_summary") or {}).get("timestamps", {})
+        for status in ("delivered", "read", "failed"):
+            if status in timestamps:
+                add(int(timestamps[status]), phone_number_id, **{status: 1})
+
+    collection = database.get_collection(ROLLUPS_COLLECTION)
+    await collection.delete_many({})
+    if keys:
+        await collection.insert_many(
+            [{"_id": key, **keys[key], **totals[key]} for key in keys], ordered=False
+        )
+    await ensure_indexes(database)
+    logger.info("Rebuilt {} rollup documents", len(keys))
@@ -0,0 +1,498 @@
+"""
+Benchmarks for /webhook ingestion and /messages dashboard queries.
+
+WhatsApp and OpenAI are replaced by in-process fakes; Mongo has to be a
+real (local) mongod, pointed to by --mongo-uri. Results go to stdout.
+
+    python -m server.bench ingest --messages 2000 --llm-latency 0.5
+    python -m server.bench dashboard --sizes 10000,100000,1000000
+    python -m server.bench knowledge --documents 100,1000,10000
+
+`ingest --batch-size N` sends N events per webhook delivery, as Meta does
+under load. `ingest --processes N` splits the traffic over N processes sharing the same
+database and state backend, to measure how throughput scales per core.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import resource
+import statistics
+import time
+
+BENCH_ENV = {
+    "WHATSAPP_APP_ID": "bench",
+    "WHATSAPP_APP_SECRET": "bench",
+    "WHATSAPP_BUSINESS_ACCOUNT_ID": "bench",
+    "WHATSAPP_ACCESS_TOKEN": "bench",
+    "WHATSAPP_API_VERSION": "v23.0",
+    "WHATSAPP_PHONE_NUMBER_ID": "bench",
+    "WHATSAPP_VERIFY_TOKEN": "bench",
+    "OPENAI_API_KEY": "bench",
+    "CLIENT_URL": "http://localhost:3000",
+    "SERVER_URL": "http://localhost:8000",
+    "ENVIRONMENT": "bench",
+    "GRAPH_BASE_URL": "http://fake-graph",
+}
+
+
+def configure_environment(args) -> None:
+    # Must run before anything imports server.settings
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["MONGO_DATABASE"] = args.database
+    os.environ["REPLY_CACHE_ENABLED"] = str(args.reply_cache).lower()
+    os.environ["STATE_BACKEND"] = args.state_backend
+
+
+def summarize(
+    name: str, latencies: list[float], elapsed: float, count: int | None = None
+) -> dict:
+    """
+    Percentiles of `latencies` and throughput of `count` (default: one
+    per latency) over `elapsed` seconds. Pass no latencies for a
+    throughput-only row.
+    """
+    count = len(latencies) if count is None else count
+    row = {
+        "scenario": name,
+        "requests": count,
+        "p50_ms": None,
+        "p95_ms": None,
+        "p99_ms": None,
+        "rps": count / elapsed if elapsed else 0.0,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100)
+        row["p50_ms"] = percentiles[49] * 1000
+        row["p95_ms"] = percentiles[94] * 1000
+        row["p99_ms"] = percentiles[98] * 1000
+    return row
+
+
+def print_report(rows: list[dict]) -> None:
+    def ms(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    header = (
+        f"{'scenario':<44} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'req/s':>9} {'rss MB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario']:<44} {row['requests']:>7} {ms(row['p50_ms'])} "
+            f"{ms(row['p95_ms'])} {ms(row['p99_ms'])} {row['rps']:>9.1f} "
+            f"{row['max_rss_mb']:>8.1f}"
+        )
+
+
+async def timed_requests(
+    client, requests, concurrency: int
+) -> tuple[list[float], float]:
+    """
+    Sends (method, url, json) requests with bounded concurrency.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def send(method, url, body):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(*request) for request in requests))
+    return latencies, time.perf_counter() - started
+
+
+class BenchApp:
+    """
+    The real app wired to the fakes, with its lifespan running.
+    """
+
+    def __init__(self, args):
+        self.args = args
+
+    async def __aenter__(self):
+        import httpx
+
+        from server.bench.fakes import FakeLLM, create_fake_graph_app
+        from server.graph import graph_client
+        from server.llm import set_fallback_llms, set_llm
+        from server.main import app
+
+        self.fake_llm = FakeLLM(
+            latency=self.args.llm_latency,
+            tail_rate=self.args.llm_tail_rate,
+            tail_latency=self.args.llm_tail_latency,
+            error_rate=self.args.llm_error_rate,
+        )
+        set_llm(self.fake_llm)
+        self.fallback_llm = FakeLLM(latency=self.args.llm_latency)
+        set_fallback_llms([("fake-fallback", self.fallback_llm)])
+
+        fake_graph = create_fake_graph_app(
+            latency=self.args.graph_latency, error_rate=self.args.graph_error_rate
+        )
+        graph_client.start(transport=httpx.ASGITransport(app=fake_graph))
+
+        self.app = app
+        self.lifespan = app.router.lifespan_context(app)
+        await self.lifespan.__aenter__()
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self.lifespan.__aexit__(*exc)
+
+    async def drain(self) -> None:
+        from server.buffer import write_buffer
+        from server.coalesce import coalescer
+        from server.settings import settings
+
+        if settings.webhook_mode == "queue":
+            await self.app.state.webhook_queue.queue.join()
+        await coalescer.drain()
+        await write_buffer.flush()
+
+    @property
+    def database(self):
+        from server.settings import settings
+
+        return self.app.state.mongo_client.get_database(settings.mongo_database)
+
+
+async def drop_database(args) -> None:
+    from server.db import create_mongo_client
+
+    mongo_client = create_mongo_client()
+    await mongo_client.drop_database(args.database)
+    await mongo_client.close()
+
+
+async def bench_ingest(args, drop: bool = True) -> list[dict]:
+    from server.bench.payloads import batched, message_traffic, status_fanout
+
+    if drop:
+        await drop_database(args)
+    rows = []
+
+    async with BenchApp(args) as bench:
+        payloads = batched(
+            list(message_traffic(args.messages, args.senders)), args.batch_size
+        )
+        message_ids = [
+            message["id"]
+            for payload in payloads
+            for message in payload["entry"][0]["changes"][0]["value"]["messages"]
+        ]
+        requests = [("POST", "/webhook", payload) for payload in payloads]
+        started = time.perf_counter()
+        latencies, elapsed = await timed_requests(
+            bench.client, requests, args.concurrency
+        )
+        rows.append(summarize("webhook ack: messages", latencies, elapsed))
+
+        await bench.drain()
+        rows.append(
+            summarize(
+                "processed: messages (LLM + send + write)",
+                [],
+                time.perf_counter() - started,
+                count=args.messages,
+            )
+        )
+
+        # Only this run's replies, other processes may share the database
+        replies = await bench.database.get_collection("messages").find(
+            {"message_id": {"$in": message_ids}, "reply_id": {"$ne": None}},
+            {"reply_id": 1, "wa_id": 1, "timestamp": 1},
+        ).to_list()
+        statuses = [
+            payload
+            for doc in replies
+            for payload in status_fanout(
+                doc["reply_id"], doc["wa_id"], doc["timestamp"]
+            )
+        ]
+        requests = [
+            ("POST", "/webhook", payload)
+            for payload in batched(statuses, args.batch_size)
+        ]
+        started = time.perf_counter()
+        latencies, elapsed = await timed_requests(
+            bench.client, requests, args.concurrency
+        )
+        rows.append(summarize("webhook ack: statuses", latencies, elapsed))
+        await bench.drain()
+        rows.append(
+            summarize(
+                "processed: statuses",
+                [],
+                time.perf_counter() - started,
+                count=len(statuses),
+            )
+        )
+
+        print(
+            f"LLM calls: {bench.fake_llm.calls} primary, "
+            f"{bench.fallback_llm.calls} fallback for {args.messages} messages"
+        )
+        print(f"Reply paths: {await reply_paths(bench.database, message_ids)}")
+
+    return rows
+
+
+async def reply_paths(database, message_ids: list[str]) -> dict[str, int]:
+    """
+    How many replies each path (cache, primary, hedge, fallback, canned) served.
+    """
+    rows = await (
+        await database.get_collection("messages").aggregate(
+            [
+                {"$match": {"message_id": {"$in": message_ids}}},
+                {
+                    "$group": {
+                        "_id": {"$ifNull": ["$llm.path", "$llm.source"]},
+                        "count": {"$sum": 1},
+                    }
+                },
+            ]
+        )
+    ).to_list()
+    return {row["_id"]: row["count"] for row in rows}
+
+
+def ingest_shard(args) -> list[dict]:
+    configure_environment(args)
+    return asyncio.run(bench_ingest(args, drop=False))
+
+
+async def bench_ingest_processes(args) -> list[dict]:
+    """
+    Runs the ingest scenario in `args.processes` processes at once and adds
+    one combined row per scenario.
+    """
+    await drop_database(args)
+    shard = argparse.Namespace(**vars(args))
+    shard.messages = args.messages // args.processes
+
+    with concurrent.futures.ProcessPoolExecutor(args.processes) as pool:
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, ingest_shard, shard)
+                for _ in range(args.processes)
+            )
+        )
+
+    rows = []
+    for index, shard_rows in enumerate(results):
+        for row in shard_rows:
+            rows.append({**row, "scenario": f"[{index}] {row['scenario']}"})
+    for position, first in enumerate(results[0]):
+        group = [shard_rows[position] for shard_rows in results]
+        count = sum(row["requests"] for row in group)
+        # The shards run concurrently, so the slowest one bounds the total
+        elapsed = max(row["requests"] / row["rps"] for row in group if row["rps"])
+        name = f"x{args.processes} {first['scenario']}"
+        rows.append(
+            {
+                **summarize(name, [], elapsed, count),
+                "max_rss_mb": sum(row["max_rss_mb"] for row in group),
+            }
+        )
+    return rows
+
+
+async def seed(args, size: int) -> None:
+    from server.bench.payloads import stored_messages
+    from server.db import create_mongo_client, ensure_indexes
+
+    mongo_client = create_mongo_client()
+    database = mongo_client.get_database(args.database)
+    await mongo_client.drop_database(args.database)
+
+    collection = database.get_collection("messages")
+    batch = []
+    started = time.perf_counter()
+    for doc in stored_messages(size, args.senders):
+        batch.append(doc)
+        if len(batch) >= 10_000:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+    await ensure_indexes(database)
+    await mongo_client.close()
+    print(f"Seeded {size} messages in {time.perf_counter() - started:.1f}s")
+
+
+async def bench_dashboard(args) -> list[dict]:
+    from server.bench.payloads import wa_ids
+
+    rows = []
+    phone = wa_ids(args.senders)[0]
+
+    for size in args.sizes:
+        await seed(args, size)
+        deep_page = max(1, size // 20 // 2)
+
+        async with BenchApp(args) as bench:
+            first = (await bench.client.get("/messages?pagination=cursor")).json()
+            scenarios = {
+                "page 1": "/messages?page=1&size=20",
+                f"page {deep_page}": f"/messages?page={deep_page}&size=20",
+                "page 1, cached count": "/messages?page=1&size=20&count=cached",
+                "cursor, next page": (
+                    f"/messages?pagination=cursor&cursor={first['next_cursor']}"
+                ),
+                "phone filter": f"/messages?phone_number={phone}",
+                "text search": "/messages?search=uniforms",
+                "phone prefix search": f"/messages?search={phone[:6]}",
+            }
+            for name, url in scenarios.items():
+                requests = [("GET", url, None)] * args.queries
+                latencies, elapsed = await timed_requests(
+                    bench.client, requests, args.concurrency
+                )
+                rows.append(summarize(f"{size:>8} msgs: {name}", latencies, elapsed))
+
+    return rows
+
+
+def bench_knowledge(args) -> list[dict]:
+    """
+    Index build, incremental reindex and retrieval latency of the knowledge
+    base, and the prompt tokens retrieval saves over sending everything.
+    """
+    from server.bench.payloads import knowledge_documents, knowledge_queries
+    from server.knowledge import KnowledgeBase
+    from server.settings import settings
+
+    rows = []
+    queries = knowledge_queries(args.queries)
+
+    for size in args.documents:
+        knowledge = KnowledgeBase(
+            directory=None,
+            collection=None,
+            chunk_words=settings.knowledge_chunk_words,
+            top_k=settings.knowledge_top_k,
+            min_score=settings.knowledge_min_score,
+            max_tokens=settings.knowledge_max_tokens,
+        )
+        documents = list(knowledge_documents(size))
+
+        started = time.perf_counter()
+        for source, text in documents:
+            knowledge.upsert(source, text)
+        elapsed = time.perf_counter() - started
+        rows.append(summarize(f"{size:>6} docs: index", [], elapsed, count=size))
+
+        changed = documents[: max(1, size // 100)]
+        started = time.perf_counter()
+        for source, text in changed:
+            knowledge.upsert(source, text + "\n\nUpdated.")
+        elapsed = time.perf_counter() - started
+        rows.append(
+            summarize(f"{size:>6} docs: reindex 1%", [], elapsed, count=len(changed))
+        )
+
+        latencies, injected = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            chunks = knowledge.retrieve(query)
+            latencies.append(time.perf_counter() - started)
+            injected += sum(chunk.tokens for chunk in chunks)
+        rows.append(
+            summarize(f"{size:>6} docs: retrieve", latencies, sum(latencies))
+        )
+
+        stuffed = knowledge.stats()["indexed_tokens"]
+        per_message = injected / len(queries)
+        print(
+            f"{size} docs: {stuffed} tokens if sent with every prompt, "
+            f"{per_message:.0f} retrieved per message "
+            f"({1 - per_message / stuffed:.1%} saved)"
+        )
+
+    return rows
+
+
+async def run_scenarios(args) -> list[dict]:
+    """
+    The async scenarios, in one event loop: module-level singletons such as
+    the write buffer and the coalescer hold asyncio primitives bound to the
+    loop that first uses them.
+    """
+    rows = []
+    if args.scenario in ("ingest", "all"):
+        if args.processes > 1:
+            rows += await bench_ingest_processes(args)
+        else:
+            rows += await bench_ingest(args)
+    if args.scenario in ("dashboard", "all"):
+        rows += await bench_dashboard(args)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "scenario", choices=["ingest", "dashboard", "knowledge", "all"]
+    )
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="bellerouze_chatbot_bench")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10_000, 100_000, 1_000_000],
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--documents",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[100, 1_000, 10_000],
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="events per webhook delivery"
+    )
+    parser.add_argument(
+        "--state-backend", choices=["mongo", "memory"], default="mongo"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-tail-latency", type=float, default=10.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--graph-latency", type=float, default=0.05)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--reply-cache", action=argparse.BooleanOptionalAction, default=True
+    )
+    args = parser.parse_args()
+
+    configure_environment(args)
+
+    rows = asyncio.run(run_scenarios(args))
+    if args.scenario in ("knowledge", "all"):
+        rows += bench_knowledge(args)
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
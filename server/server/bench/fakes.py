@@ -0,0 +1,88 @@
+import asyncio
+import random
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from langchain_core.messages import AIMessage
+
+
+class FakeLLM:
+    """
+    Stand-in for the chat model with a configurable response time.
+    `tail_rate` of the calls take `tail_latency` instead, and `error_rate`
+    of them fail. Plug it in with `server.llm.set_llm(FakeLLM(...))` or
+    `server.llm.set_fallback_llms([("fake", FakeLLM(...))])`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.1,
+        output_tokens: int = 120,
+        tail_rate: float = 0.0,
+        tail_latency: float = 10.0,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_tokens = output_tokens
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        self.calls += 1
+        delay = self.latency + random.uniform(-1, 1) * self.jitter
+        if random.random() < self.tail_rate:
+            delay = self.tail_latency
+        await asyncio.sleep(max(0.0, delay))
+
+        if random.random() < self.error_rate:
+            raise RuntimeError("Fake LLM failure")
+
+        input_tokens = sum(len(str(m.content)) // 4 + 1 for m in messages)
+        return AIMessage(
+            content=f"Thanks for asking about: {messages[-1].content[:60]}",
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": input_tokens + self.output_tokens,
+            },
+        )
+
+
+def create_fake_graph_app(latency: float = 0.05, error_rate: float = 0.0) -> FastAPI:
+    """
+    Minimal Graph API `/messages` endpoint. Returns a fresh wamid per send
+    and fails `error_rate` of the requests with a 429 or 503.
+    """
+    app = FastAPI()
+    app.state.sent = 0
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        await asyncio.sleep(latency)
+
+        if random.random() < error_rate:
+            status_code = random.choice([429, 503])
+            return JSONResponse(
+                content={"error": {"message": "Fake failure", "code": status_code}},
+                status_code=status_code,
+                headers={"Retry-After": "0"},
+            )
+
+        body = await request.json()
+        app.state.sent += 1
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body["to"], "wa_id": body["to"]}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+        }
+
+    return app
+
+
+# `uvicorn server.bench.fakes:graph_app --port 9000` for an out-of-process stub
+graph_app = create_fake_graph_app()
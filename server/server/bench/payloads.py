@@ -0,0 +1,201 @@
+import random
+import time
+import uuid
+from typing import Iterator
+
+BUSINESS_ACCOUNT_ID = "746599524843368"
+DISPLAY_PHONE_NUMBER = "254733410104"
+PHONE_NUMBER_ID = "779532008573600"
+
+QUESTIONS = [
+    "What time do you open?",
+    "what time do you open on saturday",
+    "Where are you located?",
+    "Do you do embroidery?",
+    "How much are school uniforms?",
+    "Are you open on Sunday?",
+    "What is your phone number?",
+    "Do you sell stationery and books?",
+    "Can I order online?",
+    "Hi",
+]
+
+
+def wa_ids(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [f"2547{rng.randrange(10**8):08d}" for _ in range(count)]
+
+
+def _webhook(value: dict) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": BUSINESS_ACCOUNT_ID,
+                "changes": [
+                    {
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {
+                                "display_phone_number": DISPLAY_PHONE_NUMBER,
+                                "phone_number_id": PHONE_NUMBER_ID,
+                            },
+                            **value,
+                        },
+                        "field": "messages",
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def message_payload(wa_id: str, text: str, timestamp: int) -> dict:
+    return _webhook(
+        {
+            "contacts": [{"profile": {"name": "Customer"}, "wa_id": wa_id}],
+            "messages": [
+                {
+                    "from": wa_id,
+                    "id": f"wamid.{uuid.uuid4().hex}",
+                    "timestamp": str(timestamp),
+                    "text": {"body": text},
+                    "type": "text",
+                }
+            ],
+        }
+    )
+
+
+def status_payload(
+    message_id: str, recipient_id: str, status: str, timestamp: int
+) -> dict:
+    return _webhook(
+        {
+            "statuses": [
+                {
+                    "id": message_id,
+                    "status": status,
+                    "timestamp": str(timestamp),
+                    "recipient_id": recipient_id,
+                }
+            ]
+        }
+    )
+
+
+def message_traffic(count: int, senders: int, seed: int = 0) -> Iterator[dict]:
+    """
+    Incoming text messages from `senders` customers, one second apart.
+    """
+    rng = random.Random(seed)
+    numbers = wa_ids(senders, seed)
+    start = int(time.time()) - count
+    for i in range(count):
+        yield message_payload(rng.choice(numbers), rng.choice(QUESTIONS), start + i)
+
+
+def status_fanout(reply_id: str, recipient_id: str, timestamp: int) -> list[dict]:
+    """
+    The sent/delivered/read sequence Meta delivers for every reply.
+    """
+    return [
+        status_payload(reply_id, recipient_id, status, timestamp + offset)
+        for offset, status in enumerate(["sent", "delivered", "read"])
+    ]
+
+
+def batched(payloads: list[dict], size: int) -> list[dict]:
+    """
+    Merges single-event payloads into deliveries of up to `size` events,
+    the way Meta batches them under load.
+    """
+    batches = []
+    for start in range(0, len(payloads), size):
+        values = [
+            payload["entry"][0]["changes"][0]["value"]
+            for payload in payloads[start : start + size]
+        ]
+        merged = {
+            key: [item for value in values for item in value.get(key, [])]
+            for key in ("contacts", "messages", "statuses")
+        }
+        batches.append(_webhook({k: v for k, v in merged.items() if v}))
+    return batches
+
+
+def stored_messages(count: int, senders: int, seed: int = 0) -> Iterator[dict]:
+    """
+    Documents shaped like ingested messages, for seeding dashboard benchmarks.
+    """
+    from server.utils import message_query_fields
+
+    rng = random.Random(seed)
+    numbers = wa_ids(senders, seed)
+    start = int(time.time()) - count * 60
+    for i in range(count):
+        timestamp = start + i * 60
+        wa_id = rng.choice(numbers)
+        data = message_payload(wa_id, rng.choice(QUESTIONS), timestamp)
+        reply_id = f"wamid.{uuid.uuid4().hex}"
+        output = {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": wa_id, "wa_id": wa_id}],
+            "messages": [{"id": reply_id}],
+        }
+        yield {
+            "input": data,
+            "output": output,
+            "reply_text": "Thanks for asking, we open at 6 am on weekdays.",
+            "version": "v23.0",
+            **message_query_fields(data, output),
+            "status_summary": {
+                "timestamps": {
+                    "sent": str(timestamp + 1),
+                    "delivered": str(timestamp + 2),
+                    "read": str(timestamp + 3),
+                },
+                "latest": "read",
+                "order_key": (timestamp + 3) * 10 + 3,
+                "recipient_id": wa_id,
+                "display_phone_number": DISPLAY_PHONE_NUMBER,
+                "errors": [],
+            },
+        }
+
+
+SCHOOLS = ["Hillcrest", "Riverside", "St. Mary's", "Greenfield", "Lakeview", "Kilimani"]
+ITEMS = ["sweater", "shirt", "skirt", "trousers", "blazer", "tie", "socks", "tracksuit"]
+COLOURS = ["navy", "maroon", "green", "grey", "white", "sky blue"]
+
+
+def knowledge_documents(count: int, seed: int = 0) -> Iterator[tuple[str, str]]:
+    """
+    (source, markdown) product sheets shaped like a growing uniform FAQ.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        school, item = rng.choice(SCHOOLS), rng.choice(ITEMS)
+        colour = rng.choice(COLOURS)
+        sizes = ", ".join(f"{age} yrs" for age in range(4, 18, rng.choice([2, 3])))
+        yield f"bench:{i}", (
+            f"# {school} {item} ({colour}) #{i}\n\n"
+            f"The {school} school {item} comes in {colour} with the school badge "
+            f"embroidered on the chest. Sizes: {sizes}.\n\n"
+            f"Price: KES {rng.randrange(500, 4000, 50)}. Delivery within Nairobi "
+            f"takes {rng.randint(1, 5)} days; collection is free at the shop."
+        )
+
+
+def knowledge_queries(count: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    templates = [
+        "How much is the {school} {item}?",
+        "do you have {school} {item} in size 10",
+        "What colour is the {school} {item}",
+        "Is there delivery for {item}s?",
+    ]
+    return [
+        rng.choice(templates).format(school=rng.choice(SCHOOLS), item=rng.choice(ITEMS))
+        for _ in range(count)
+    ]
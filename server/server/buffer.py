@@ -0,0 +1,192 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout
+
+from server.logger import logger
+from server.settings import settings
+
+# Raw statuses land before messages so post-insert status folds can find them
+FLUSH_ORDER = ("statuses", "messages")
+
+# Failures where the write may not have reached the server and is retried
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout)
+DUPLICATE_KEY = 11000
+
+Operation = InsertOne | UpdateOne
+Callback = Callable[[], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class Write:
+    operation: Operation
+    after_flush: Callback | None = None
+    attempts: int = 0
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for ingestion writes.
+
+    Operations are grouped per collection and sent with one unordered
+    bulk_write when the buffer reaches `max_size` or `max_latency_seconds`
+    after the last flush, whichever comes first. `stop` flushes whatever is
+    left, so a clean shutdown loses nothing; a crash loses at most one
+    buffer's worth of writes.
+
+    A batch that fails with a connection error or timeout is queued again,
+    up to `max_retries` times. Once `max_pending` writes are waiting, new
+    writes skip the buffer and go straight to Mongo, so an outage can't grow
+    it without bound. `after_flush` callbacks only run for writes that
+    landed.
+    """
+
+    def __init__(self):
+        self.database: AsyncDatabase | None = None
+        self.pending: defaultdict[str, list[Write]] = defaultdict(list)
+        self.size = 0
+        self.lock = asyncio.Lock()
+        self.full = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.retries = 0
+        self.direct = 0
+
+    def start(self, database: AsyncDatabase) -> None:
+        self.database = database
+        if settings.write_buffer_enabled:
+            self.task = asyncio.create_task(self._run(), name="write-buffer")
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        # Writes queued again by a failed flush use up their retries
+        while self.size:
+            await asyncio.sleep(settings.write_buffer_max_latency_seconds)
+            await self.flush()
+
+    async def add(
+        self, collection: str, operation: Operation, after_flush: Callback | None = None
+    ) -> None:
+        """
+        Queues a write; `after_flush` runs once the write has landed.
+        """
+        if self.task is None or self.size >= settings.write_buffer_max_pending:
+            # Buffering disabled, or backed up: write straight through
+            if self.task is not None:
+                self.direct += 1
+            await self.database.get_collection(collection).bulk_write([operation])
+            if after_flush:
+                await after_flush()
+            return
+
+        self.pending[collection].append(Write(operation, after_flush))
+        self.size += 1
+        if self.size >= settings.write_buffer_max_size:
+            self.full.set()
+
+    async def flush(self) -> None:
+        async with self.lock:
+            if not self.size:
+                return
+
+            pending, self.pending = self.pending, defaultdict(list)
+            self.size = 0
+
+            names = sorted(
+                pending,
+                key=lambda n: FLUSH_ORDER.index(n)
+                if n in FLUSH_ORDER
+                else len(FLUSH_ORDER),
+            )
+            callbacks = []
+            for name in names:
+                for write in await self._write(name, pending[name]):
+                    if write.after_flush:
+                        callbacks.append(write.after_flush)
+
+            self.flushes += 1
+
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.exception(f"❌ Post-flush callback failed: {str(e)}")
+
+    async def _write(self, name: str, batch: list[Write]) -> list[Write]:
+        """
+        Sends one collection's batch; returns the writes that landed.
+        """
+        try:
+            await self.database.get_collection(name).bulk_write(
+                [write.operation for write in batch], ordered=False
+            )
+        except BulkWriteError as e:
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                index = error["index"]
+                # An insert from an earlier attempt that did land
+                if error.get("code") == DUPLICATE_KEY and batch[index].attempts:
+                    continue
+                failed.add(index)
+            if failed:
+                self.errors += len(failed)
+                logger.error("❌ {} buffered writes to {} failed", len(failed), name)
+            landed = [write for i, write in enumerate(batch) if i not in failed]
+        except TRANSIENT_ERRORS as e:
+            retry = [w for w in batch if w.attempts < settings.write_buffer_max_retries]
+            for write in retry:
+                write.attempts += 1
+            # Ahead of newer writes, to keep their order
+            self.pending[name][:0] = retry
+            self.size += len(retry)
+            self.retries += len(retry)
+            self.errors += len(batch) - len(retry)
+            logger.warning(
+                "⚠️ Buffered write to {} failed ({!r}), {} queued again, {} dropped",
+                name,
+                e,
+                len(retry),
+                len(batch) - len(retry),
+            )
+            return []
+        except Exception as e:
+            self.errors += len(batch)
+            logger.exception(f"❌ Buffered write to {name} failed: {str(e)}")
+            return []
+
+        self.written += len(landed)
+        return landed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.full.wait(), timeout=settings.write_buffer_max_latency_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.size,
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "retries": self.retries,
+            "direct": self.direct,
+        }
+
+
+write_buffer = WriteBuffer()
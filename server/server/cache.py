@@ -0,0 +1,183 @@
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+from server.settings import settings
+from server.state import StateBackend
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case, punctuation and whitespace insensitive form of a message.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def trigram_vector(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def cosine(a: Counter, b: Counter, norm_a: float, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(count * b[gram] for gram, count in a.items()) / (norm_a * norm_b)
+
+
+@dataclass(slots=True)
+class CachedReply:
+    reply: str
+    expires_at: float
+    vector: Counter
+    norm: float
+    latency: float
+    tokens: int
+
+
+class ReplyCache:
+    """
+    Reply cache in front of the LLM.
+
+    Lookups try the exact normalized text first, then (when enabled) the most
+    similar cached question by character-trigram cosine similarity. Entries
+    are bound to a fingerprint of the system prompt, so editing the prompt
+    empties the cache.
+
+    With a `shared` state backend, exact matches missed locally are also
+    looked up there, so replies generated by one worker serve all of them.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl_seconds: float,
+        similarity: bool,
+        similarity_threshold: float,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.similarity_threshold = similarity_threshold
+        self.entries: OrderedDict[str, CachedReply] = OrderedDict()
+        self.prompt_fingerprint: str | None = None
+        self.shared: StateBackend | None = None
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    def _check_prompt(self, system_prompt: str) -> None:
+        fingerprint = hashlib.sha256(system_prompt.encode()).hexdigest()
+        if fingerprint != self.prompt_fingerprint:
+            self.entries.clear()
+            self.prompt_fingerprint = fingerprint
+
+    def _shared_key(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f"reply:{self.prompt_fingerprint[:16]}:{digest}"
+
+    async def get(self, system_prompt: str, text: str) -> str | None:
+        self._check_prompt(system_prompt)
+        key = normalize_text(text)
+        now = time.monotonic()
+
+        entry = self.entries.get(key)
+        if entry and entry.expires_at < now:
+            del self.entries[key]
+            entry = None
+
+        if entry:
+            self.exact_hits += 1
+        elif self.shared is not None and (
+            shared := await self.shared.get(self._shared_key(key))
+        ):
+            self.shared_hits += 1
+            self._store(key, **shared)
+            entry = self.entries[key]
+        elif self.similarity:
+            entry = self._most_similar(key, now)
+            if entry:
+                self.similar_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.saved_seconds += entry.latency
+        self.saved_tokens += entry.tokens
+        return entry.reply
+
+    async def put(
+        self, system_prompt: str, text: str, reply: str, latency: float, tokens: int
+    ) -> None:
+        self._check_prompt(system_prompt)
+        key = normalize_text(text)
+        self._store(key, reply, latency, tokens)
+        if self.shared is not None:
+            await self.shared.set(
+                self._shared_key(key),
+                {"reply": reply, "latency": latency, "tokens": tokens},
+                self.ttl_seconds,
+            )
+
+    def _store(self, key: str, reply: str, latency: float, tokens: int) -> None:
+        vector = trigram_vector(key)
+        self.entries[key] = CachedReply(
+            reply=reply,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            vector=vector,
+            norm=math.sqrt(sum(v * v for v in vector.values())),
+            latency=latency,
+            tokens=tokens,
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def _most_similar(self, key: str, now: float) -> CachedReply | None:
+        vector = trigram_vector(key)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+
+        best, best_score = None, self.similarity_threshold
+        for entry in self.entries.values():
+            if entry.expires_at < now:
+                continue
+            score = cosine(vector, entry.vector, norm, entry.norm)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.similar_hits + self.shared_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "saved_tokens": self.saved_tokens,
+            "size": len(self.entries),
+        }
+
+
+reply_cache = ReplyCache(
+    maxsize=settings.reply_cache_size,
+    ttl_seconds=settings.reply_cache_ttl_seconds,
+    similarity=settings.reply_cache_similarity,
+    similarity_threshold=settings.reply_cache_similarity_threshold,
+)
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from server.logger import logger
+from server.metrics import errors
+from server.settings import settings
+from server.webhook import MessageEvent
+
+TurnHandler = Callable[[list[MessageEvent]], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class Batch:
+    events: list[MessageEvent]
+    first_at: float
+    last_at: float
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+def merge_fragments(events: list[MessageEvent]) -> MessageEvent:
+    """
+    One message standing for a coalesced turn: the last fragment's ids and
+    timestamp, with the text of every fragment.
+    """
+    last = events[-1]
+    if len(events) == 1:
+        return last
+
+    text = "\n".join(event.text for event in events)
+    entry = last.payload["entry"][0]
+    change = entry["changes"][0]
+    value = change["value"]
+    message = {**value["messages"][0], "text": {"body": text}}
+    payload = {
+        **last.payload,
+        "entry": [
+            {
+                **entry,
+                "changes": [{**change, "value": {**value, "messages": [message]}}],
+            }
+        ],
+    }
+    return MessageEvent(
+        message_id=last.message_id,
+        from_number=last.from_number,
+        phone_number_id=last.phone_number_id,
+        display_phone_number=last.display_phone_number,
+        timestamp=last.timestamp,
+        text=text,
+        payload=payload,
+        profile_name=last.profile_name,
+    )
+
+
+class Coalescer:
+    """
+    Merges messages a sender fires off in quick succession into one turn.
+
+    `submit` never waits. The first fragment opens a batch and starts a task
+    that runs the turn once no fragment has arrived for `window_seconds`, the
+    batch is `max_wait_seconds` old or it holds `max_fragments`. Later
+    fragments join the open batch. Fragments arriving while a turn is being
+    generated (or once a batch is full) open the next batch, which runs as a
+    follow-up after it rather than alongside. At most `max_concurrency` turns
+    call the handler at once.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        max_wait_seconds: float,
+        max_fragments: int,
+        max_concurrency: int,
+    ):
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.max_fragments = max_fragments
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.open: dict[str, Batch] = {}
+        self.running: dict[str, Batch] = {}
+        self.tasks: dict[asyncio.Task, Batch] = {}
+        self.flushing = False
+        self.turns = 0
+        self.fragments = 0
+        self.follow_ups = 0
+
+    async def submit(self, event: MessageEvent, handler: TurnHandler) -> None:
+        key = f"{event.phone_number_id}:{event.from_number}"
+        now = time.monotonic()
+        self.fragments += 1
+
+        batch = self.open.get(key)
+        if batch is not None and len(batch.events) < self.max_fragments:
+            batch.events.append(event)
+            batch.last_at = now
+            batch.changed.set()
+            return
+
+        # Queues behind a full batch or the turn being generated
+        previous = batch or self.running.get(key)
+        if previous is not None:
+            self.follow_ups += 1
+        batch = self.open[key] = Batch(events=[event], first_at=now, last_at=now)
+        task = asyncio.create_task(
+            self._turn(key, batch, previous, handler), name=f"coalesce-{key}"
+        )
+        self.tasks[task] = batch
+        task.add_done_callback(lambda done: self.tasks.pop(done, None))
+
+    async def drain(self, timeout: float | None = None) -> list[MessageEvent]:
+        """
+        Runs the open batches without waiting out their windows, then waits
+        for every turn to finish. Turns still running after `timeout` are
+        cancelled, and their events returned so the caller can keep them.
+        """
+        self.flushing = True
+        for batch in self.open.values():
+            batch.changed.set()
+        try:
+            if not self.tasks:
+                return []
+            _, pending = await asyncio.wait(list(self.tasks), timeout=timeout)
+            if not pending:
+                return []
+
+            logger.warning(
+                "⚠️ Coalescer drain timed out with {} turns left", len(pending)
+            )
+            unfinished = [
+                event for task in pending for event in self.tasks[task].events
+            ]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            return unfinished
+        finally:
+            self.flushing = False
+
+    async def _turn(
+        self,
+        key: str,
+        batch: Batch,
+        previous: Batch | None,
+        handler: TurnHandler,
+    ) -> None:
+        try:
+            if previous is not None:
+                await previous.done.wait()
+            await self._collect(batch)
+        finally:
+            if self.open.get(key) is batch:
+                del self.open[key]
+
+        self.running[key] = batch
+        self.turns += 1
+        try:
+            async with self.slots:
+                await handler(batch.events)
+        except Exception as e:
+            errors.inc(component="coalescer", type=type(e).__name__)
+            logger.exception("❌ Error processing coalesced turn: {!r}", e)
+        finally:
+            batch.done.set()
+            if self.running.get(key) is batch:
+                del self.running[key]
+
+    async def _collect(self, batch: Batch) -> None:
+        while not self.flushing and len(batch.events) < self.max_fragments:
+            deadline = min(
+                batch.last_at + self.window_seconds,
+                batch.first_at + self.max_wait_seconds,
+            )
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return
+            batch.changed.clear()
+            try:
+                await asyncio.wait_for(batch.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "fragments": self.fragments,
+            "follow_ups": self.follow_ups,
+            "fragments_per_turn": self.fragments / self.turns if self.turns else 0.0,
+            "open": len(self.open),
+            "running": len(self.running),
+        }
+
+
+coalescer = Coalescer(
+    window_seconds=settings.coalesce_window_seconds,
+    max_wait_seconds=settings.coalesce_max_wait_seconds,
+    max_fragments=settings.coalesce_max_fragments,
+    # Keeps LLM and Graph calls to what the worker pool would allow
+    max_concurrency=settings.webhook_workers,
+)
@@ -1,20 +1,71 @@
-# from pymongo import AsyncMongoClient, MongoClient
-# from pymongo.server_api import ServerApi
+from fastapi import Request
+from pymongo import ASCENDING, DESCENDING, TEXT, AsyncMongoClient, IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
 
-# from server.settings import settings
+from server.metrics import MongoCommandMetrics
+from server.settings import settings
 
-# mongo_uri = (
-#     "mongodb://"
-#     f"{settings.mongo_initdb_root_username}:{settings.mongo_initdb_root_password}"
-#     "@"
-#     f"{settings.mongo_host}:{settings.mongo_port}/?authSource=admin"
-# )
 
+def create_mongo_client() -> AsyncMongoClient:
+    """
+    Builds the single pooled client shared by the whole app.
+    Created once in the lifespan and closed on shutdown.
+    """
+    return AsyncMongoClient(
+        settings.mongo_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+        event_listeners=[MongoCommandMetrics()],
+    )
 
-# async_mongo_client = AsyncMongoClient(
-#     mongo_uri,
-#     server_api=ServerApi(version="1", strict=True, deprecation_errors=True),
-# )
 
+def get_database(request: Request) -> AsyncDatabase:
+    """
+    FastAPI dependency returning the app database from the shared client.
+    """
+    return request.app.state.mongo_client.get_database(settings.mongo_database)
 
-# mongo_client = MongoClient(mongo_uri)
+
+# Every filter/sort combination /messages supports, newest first with _id as tie-breaker
+MESSAGE_INDEXES = [
+    IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)], name="timestamp"),
+    IndexModel(
+        [("wa_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+        name="wa_id_timestamp",
+    ),
+    # Serves sort_field=wa_id, which sorts on (wa_id, _id)
+    IndexModel([("wa_id", ASCENDING), ("_id", ASCENDING)], name="wa_id_id"),
+    IndexModel([("message_id", ASCENDING)], name="message_id", sparse=True),
+    IndexModel([("reply_id", ASCENDING)], name="reply_id", sparse=True),
+    IndexModel(
+        [("text", TEXT), ("reply_text", TEXT)],
+        name="text_search",
+        weights={"text": 2, "reply_text": 1},
+    ),
+]
+
+# No longer used by any query; dropped where an older version created them
+OBSOLETE_MESSAGE_INDEXES = ["phone_number_id_timestamp"]
+
+STATUS_INDEXES = [
+    IndexModel(
+        [("message_id", ASCENDING), ("timestamp", ASCENDING)], name="message_id"
+    ),
+]
+
+
+async def ensure_indexes(database: AsyncDatabase) -> None:
+    """
+    Creates the indexes the API relies on. Safe to run on every startup.
+    """
+    messages = database.get_collection("messages")
+    await messages.create_indexes(MESSAGE_INDEXES)
+    existing = await messages.index_information()
+    for name in OBSOLETE_MESSAGE_INDEXES:
+        if name in existing:
+            await messages.drop_index(name)
+    await database.get_collection("statuses").create_indexes(STATUS_INDEXES)
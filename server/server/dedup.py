@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+
+from server.state import StateBackend
+from server.webhook import WebhookEvent
+
+
+def event_key(parsed: WebhookEvent) -> str | None:
+    """
+    Stable id for a webhook event. Statuses share the message id, so the
+    status value is part of the key (sent, delivered and read are distinct).
+    """
+    if parsed.type == "message":
+        return f"message:{parsed.message_id}" if parsed.message_id else None
+    return f"status:{parsed.message_id}:{parsed.status}"
+
+
+class SeenIds:
+    """
+    Bounded LRU of recently seen keys with a per-entry TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict[str, float] = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self.entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def add(self, key: str) -> None:
+        self.entries[key] = time.monotonic() + self.ttl_seconds
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+
+class Deduplicator:
+    """
+    Rejects webhook events that were already accepted.
+
+    The in-memory set answers most retries without a round trip; the shared
+    state backend is the source of truth across restarts and workers.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        maxsize: int,
+        memory_ttl_seconds: float,
+        store_ttl_seconds: int,
+    ):
+        self.backend = backend
+        self.seen = SeenIds(maxsize=maxsize, ttl_seconds=memory_ttl_seconds)
+        self.store_ttl_seconds = store_ttl_seconds
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    async def claim(self, key: str) -> bool:
+        """
+        Returns True the first time a key is seen, False for duplicates.
+        """
+        if key in self.seen:
+            self.memory_hits += 1
+            return False
+
+        claimed = await self.backend.claim(f"event:{key}", self.store_ttl_seconds)
+        self.seen.add(key)
+        if not claimed:
+            self.store_hits += 1
+            return False
+
+        self.misses += 1
+        return True
+
+    async def release(self, key: str) -> None:
+        """
+        Forgets a key so a retry of an event we did not accept gets processed.
+        """
+        self.seen.discard(key)
+        await self.backend.release(f"event:{key}")
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.store_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "cached_ids": len(self.seen.entries),
+        }
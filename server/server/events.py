@@ -0,0 +1,95 @@
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from fastapi.encoders import jsonable_encoder
+
+from server.logger import logger
+from server.settings import settings
+
+
+@dataclass(eq=False)
+class Subscription:
+    phone_number: str | None
+    queue: asyncio.Queue
+    lagged: bool = False
+    dropped: int = field(default=0)
+
+
+class EventBroker:
+    """
+    In-process fan-out of live events to dashboard viewers.
+
+    `publish` never blocks ingestion: every subscriber has a bounded queue,
+    and a viewer that falls behind loses its oldest events and is sent a
+    `resync` event telling it to refetch instead.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscriptions: set[Subscription] = set()
+        self.published = 0
+
+    def subscribe(self, phone_number: str | None = None) -> Subscription:
+        subscription = Subscription(
+            phone_number=phone_number, queue=asyncio.Queue(maxsize=self.queue_size)
+        )
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def publish(self, event: str, phone_number: str, data) -> None:
+        if not self.subscriptions:
+            return
+
+        self.published += 1
+        # Serialized once, shared by every viewer
+        message = f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+        for subscription in self.subscriptions:
+            if subscription.phone_number not in (None, phone_number):
+                continue
+            if subscription.queue.full():
+                subscription.queue.get_nowait()
+                subscription.dropped += 1
+                subscription.lagged = True
+            subscription.queue.put_nowait(message)
+
+    async def stream(
+        self, subscription: Subscription, heartbeat_seconds: float
+    ) -> AsyncIterator[str]:
+        """
+        Server-sent events for one viewer, with comment heartbeats so proxies
+        keep the connection open and dead clients are noticed.
+        """
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+            if subscription.dropped:
+                logger.info(
+                    "Live viewer disconnected after dropping {} events",
+                    subscription.dropped,
+                )
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self.subscriptions), "published": self.published}
+
+
+event_broker = EventBroker(queue_size=settings.events_queue_size)
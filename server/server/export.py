@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Literal
+
+from fastapi.encoders import jsonable_encoder
+from pymongo.asynchronous.collection import AsyncCollection
+
+from server.schemas import ReplyMessage
+from server.statuses import parse_status_summary
+from server.utils import parse_incoming_message, parse_reply_message
+
+ExportFormat = Literal["ndjson", "csv"]
+
+CSV_COLUMNS = [
+    "timestamp",
+    "phone_number_id",
+    "from_number",
+    "incoming_message",
+    "reply_message_id",
+    "reply_message",
+    "latest_status",
+    "sent_at",
+    "delivered_at",
+    "read_at",
+    "failed_at",
+]
+
+# Flush to the client roughly every this many characters
+CHUNK_SIZE = 64 * 1024
+CURSOR_BATCH_SIZE = 500
+
+
+def _epoch(value: datetime) -> int:
+    # Naive values are UTC, not the server's local time
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def export_filter(
+    start: datetime | None, end: datetime | None, phone_number: str | None
+) -> dict:
+    query: dict = {}
+    if phone_number:
+        query["wa_id"] = phone_number
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = _epoch(start)
+        if end:
+            query["timestamp"]["$lt"] = _epoch(end)
+    return query
+
+
+def _parse(raw: dict) -> dict | None:
+    incoming = parse_incoming_message(raw["input"])
+    if incoming is None:
+        return None
+    if "messages" not in raw["output"]:
+        # The send failed and Graph returned an error; there is no reply
+        reply = ReplyMessage(to_number=incoming.from_number, message_id="", message="")
+        return {"incoming_message": incoming, "reply_message": reply, "statuses": []}
+
+    reply = parse_reply_message(raw["output"], raw["reply_text"])
+    statuses = parse_status_summary(reply.message_id, raw.get("status_summary"))
+    return {"incoming_message": incoming, "reply_message": reply, "statuses": statuses}
+
+
+def _csv_row(item: dict) -> list:
+    incoming, reply = item["incoming_message"], item["reply_message"]
+    at = {status.status: status.timestamp for status in item["statuses"]}
+    latest = item["statuses"][-1].status if item["statuses"] else ""
+    return [
+        incoming.timestamp,
+        incoming.phone_number_id,
+        incoming.from_number,
+        incoming.incoming_message,
+        reply.message_id,
+        reply.message,
+        latest,
+        at.get("sent", ""),
+        at.get("delivered", ""),
+        at.get("read", ""),
+        at.get("failed", ""),
+    ]
+
+
+async def export_messages(
+    collection: AsyncCollection, query: dict, format: ExportFormat
+) -> AsyncIterator[str]:
+    """
+    Streams matching messages oldest first, in chunks, holding at most one
+    cursor batch and one chunk in memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(CSV_COLUMNS)
+
+    cursor = collection.find(
+        query,
+        {"input": 1, "output": 1, "reply_text": 1, "status_summary": 1},
+        batch_size=CURSOR_BATCH_SIZE,
+    ).sort([("timestamp", 1), ("_id", 1)])
+
+    async for raw in cursor:
+        item = _parse(raw)
+        if item is None:
+            continue
+
+        if format == "csv":
+            writer.writerow(_csv_row(item))
+        else:
+            buffer.write(json.dumps(jsonable_encoder(item), ensure_ascii=False))
+            buffer.write("\n")
+
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Literal
+
+from langchain_core.messages import BaseMessage
+
+from server.logger import logger
+from server.metrics import errors, llm_in_flight, llm_replies, llm_seconds
+from server.settings import settings
+
+Path = Literal["primary", "hedge", "fallback", "canned"]
+
+
+class CircuitBreaker:
+    """
+    Stops calling a model after `failure_threshold` consecutive failures.
+
+    Once `reset_seconds` have passed a single trial call is let through;
+    success closes the breaker again, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    @property
+    def state(self) -> Literal["closed", "open", "half_open"]:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open" and not self.trial:
+            self.trial = True
+            return True
+        return state == "closed"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+@dataclass(slots=True)
+class GatewayResult:
+    response: Any | None
+    model: str
+    path: Path
+
+
+class LLMGateway:
+    """
+    Calls an ordered chain of chat models with a deadline per model.
+
+    If a call is still running after `hedge_delay_seconds`, a second identical
+    request is sent and whichever answers first wins. A model that fails or
+    misses its deadline hands over to the next one in the chain, and models
+    whose circuit breaker is open are skipped. When none can answer, the
+    result has no response and the caller sends the canned reply.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: float,
+        hedge_delay_seconds: float,
+        failure_threshold: int,
+        reset_seconds: float,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(
+                self.failure_threshold, self.reset_seconds
+            )
+        return breaker
+
+    async def invoke(
+        self, messages: list[BaseMessage], chain: list[tuple[str, Any]]
+    ) -> GatewayResult:
+        for position, (model, llm) in enumerate(chain):
+            breaker = self.breaker(model)
+            if not breaker.allow():
+                continue
+
+            try:
+                async with asyncio.timeout(self.deadline_seconds):
+                    response, hedged = await self._hedged(model, llm, messages)
+            except asyncio.CancelledError:
+                # Don't leave a half-open breaker waiting on a dead trial
+                breaker.trial = False
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                errors.inc(component="llm", type=type(e).__name__)
+                logger.warning("⚠️ LLM {} failed: {!r}", model, e)
+                continue
+
+            breaker.record_success()
+            path = "fallback" if position else "hedge" if hedged else "primary"
+            llm_replies.inc(path=path, model=model)
+            return GatewayResult(response=response, model=model, path=path)
+
+        llm_replies.inc(path="canned", model="")
+        logger.warning("⚠️ No LLM available, sending the canned reply")
+        return GatewayResult(response=None, model="", path="canned")
+
+    async def _hedged(
+        self, model: str, llm: Any, messages: list[BaseMessage]
+    ) -> tuple[Any, bool]:
+        first = asyncio.create_task(self._call(model, llm, messages))
+        hedge = None
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(
+                pending, timeout=self.hedge_delay_seconds or None
+            )
+            if not done:
+                self.hedges += 1
+                hedge = asyncio.create_task(self._call(model, llm, messages))
+                pending.add(hedge)
+
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result(), task is hedge
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, model: str, llm: Any, messages: list[BaseMessage]) -> Any:
+        with (
+            llm_in_flight.track(),
+            llm_seconds.time(model=model, outcome="error") as labels,
+        ):
+            try:
+                response = await llm.ainvoke(messages)
+            except asyncio.CancelledError:
+                labels["outcome"] = "cancelled"
+                raise
+            labels["outcome"] = "ok"
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "open_breakers": sum(
+                breaker.state == "open" for breaker in self.breakers.values()
+            ),
+        }
+
+
+llm_gateway = LLMGateway(
+    deadline_seconds=settings.llm_deadline_seconds,
+    hedge_delay_seconds=settings.llm_hedge_delay_seconds,
+    failure_threshold=settings.llm_breaker_failures,
+    reset_seconds=settings.llm_breaker_reset_seconds,
+)
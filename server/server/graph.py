@@ -0,0 +1,170 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from server.logger import logger
+from server.metrics import errors, graph_in_flight, graph_retries, graph_seconds
+from server.settings import settings
+from server.state import StateBackend
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Errors raised before the request was sent, so a retry can't send twice.
+# Read timeouts or dropped connections may come after Meta accepted it.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    """
+    Reads how long the Graph API asked us to wait, if it said so.
+    """
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    # Business use case throttling reports minutes until access is regained
+    usage = response.headers.get("x-business-use-case-usage")
+    if usage:
+        try:
+            for entries in json.loads(usage).values():
+                for entry in entries:
+                    minutes = entry.get("estimated_time_to_regain_access") or 0
+                    if minutes:
+                        return float(minutes) * 60
+        except (ValueError, AttributeError, TypeError):
+            pass
+
+    return None
+
+
+class GraphClient:
+    """
+    Long-lived client for the WhatsApp Graph API.
+
+    Keeps a pooled (optionally HTTP/2) connection to graph.facebook.com,
+    retries 429/5xx and failed connects with jittered backoff and caps
+    concurrent sends per phone number id. With a shared `state` backend,
+    sends per phone number id are also rate limited across worker processes.
+    `start` and `aclose` are called from the app lifespan.
+    """
+
+    def __init__(self):
+        self.client: httpx.AsyncClient | None = None
+        self.state: StateBackend | None = None
+        self.semaphores: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(settings.graph_max_concurrency_per_number)
+        )
+
+    def start(self, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        """
+        `transport` lets benchmarks route requests to an in-process stub.
+        """
+        if self.client is not None:
+            return
+
+        http2 = settings.graph_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("⚠️ h2 is not installed, falling back to HTTP/1.1")
+                http2 = False
+
+        self.client = httpx.AsyncClient(
+            base_url=f"{settings.graph_base_url}/{settings.whatsapp_api_version}",
+            headers={
+                "Authorization": f"Bearer {settings.whatsapp_access_token}",
+                "Content-Type": "application/json",
+            },
+            timeout=httpx.Timeout(
+                settings.graph_timeout_seconds,
+                connect=settings.graph_connect_timeout_seconds,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.graph_max_connections,
+                max_keepalive_connections=settings.graph_max_keepalive_connections,
+                keepalive_expiry=settings.graph_keepalive_expiry_seconds,
+            ),
+            http2=http2,
+            transport=transport,
+        )
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def post_message(self, phone_number_id: str, payload: dict) -> httpx.Response:
+        if self.client is None:
+            self.start()
+
+        async with self.semaphores[phone_number_id]:
+            await self._wait_for_rate(phone_number_id)
+            attempt = 0
+            while True:
+                try:
+                    response = await self._post(phone_number_id, payload)
+                except httpx.TransportError as e:
+                    if (
+                        not isinstance(e, RETRY_ERRORS)
+                        or attempt >= settings.graph_max_retries
+                    ):
+                        errors.inc(component="graph", type=type(e).__name__)
+                        raise
+                    graph_retries.inc(reason="transport")
+                    delay = self._backoff(attempt)
+                    logger.warning(
+                        "⚠️ Graph API transport error ({}), retrying in {:.2f}s",
+                        e,
+                        delay,
+                    )
+                else:
+                    if (
+                        response.status_code not in RETRY_STATUSES
+                        or attempt >= settings.graph_max_retries
+                    ):
+                        return response
+                    graph_retries.inc(reason=str(response.status_code))
+                    delay = retry_after_seconds(response) or self._backoff(attempt)
+                    logger.warning(
+                        "⚠️ Graph API returned {}, retrying in {:.2f}s",
+                        response.status_code,
+                        delay,
+                    )
+
+                attempt += 1
+                await asyncio.sleep(min(delay, settings.graph_max_backoff_seconds))
+
+    async def _post(self, phone_number_id: str, payload: dict) -> httpx.Response:
+        with graph_in_flight.track(), graph_seconds.time(status="error") as labels:
+            response = await self.client.post(
+                f"/{phone_number_id}/messages", json=payload
+            )
+            labels["status"] = str(response.status_code)
+            return response
+
+    async def _wait_for_rate(self, phone_number_id: str) -> None:
+        limit = settings.graph_max_sends_per_second_per_number
+        if self.state is None or not limit:
+            return
+        # Fixed one-second windows counted in the shared backend
+        while True:
+            now = time.time()
+            window = f"rate:graph:{phone_number_id}:{int(now)}"
+            if await self.state.incr(window, ttl_seconds=5) <= limit:
+                return
+            await asyncio.sleep(1 - now % 1)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter
+        ceiling = settings.graph_backoff_base_seconds * (2**attempt)
+        return random.uniform(0, min(ceiling, settings.graph_max_backoff_seconds))
+
+
+graph_client = GraphClient()
@@ -0,0 +1,166 @@
+from pymongo import InsertOne
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server import analytics
+from server.buffer import write_buffer
+from server.coalesce import coalescer, merge_fragments
+from server.events import event_broker
+from server.logger import logger
+from server.memory import conversation_memory
+from server.metrics import errors, webhook_seconds
+from server.settings import settings
+from server.statuses import fold_pending_statuses, fold_status_operation
+from server.utils import (
+    build_reply_message,
+    generate_reply,
+    message_query_fields,
+    parse_reply_message,
+    send_whatsapp_message,
+    status_query_fields,
+)
+from server.webhook import MessageEvent, StatusEvent, WebhookEvent
+
+
+async def process_webhook(database: AsyncDatabase, parsed: WebhookEvent) -> None:
+    """
+    Does the slow part of a webhook event: LLM reply, Graph API send and
+    persistence. Shared by the inline handler and the background workers.
+    """
+    with webhook_seconds.time(type=parsed.type):
+        try:
+            await _process_webhook(database, parsed)
+        except Exception as e:
+            errors.inc(component="webhook", type=type(e).__name__)
+            raise
+
+
+async def _process_webhook(database: AsyncDatabase, parsed: WebhookEvent) -> None:
+    if parsed.type == "message":
+        if settings.coalesce_enabled:
+            await coalescer.submit(parsed, lambda events: _reply(database, events))
+        else:
+            await _reply(database, [parsed])
+
+    elif parsed.type == "status":
+        await _record_status(parsed)
+
+    else:
+        logger.warning("⚠️ Unknown webhook type: {}", parsed.type)
+
+
+async def _reply(database: AsyncDatabase, fragments: list[MessageEvent]) -> None:
+    """
+    One LLM turn and reply for one or more coalesced messages.
+    """
+    parsed = merge_fragments(fragments)
+    data = parsed.payload
+    if len(fragments) > 1:
+        logger.info(
+            "🧩 Coalesced {} messages from {}", len(fragments), parsed.from_number
+        )
+
+    history, context = None, None
+    if settings.memory_enabled:
+        turns = await conversation_memory.history(database, parsed.from_number)
+        history = conversation_memory.to_messages(turns)
+    if history:
+        # Only mid-conversation, so first questions stay cacheable
+        context = {"Customer name": parsed.profile_name}
+
+    reply = await generate_reply(parsed.text, history, context)
+    reply_text = reply.text
+
+    if settings.memory_enabled:
+        conversation_memory.append(
+            parsed.from_number,
+            parsed.text,
+            reply_text,
+            timestamp=float(parsed.timestamp),
+        )
+    payload = build_reply_message(to=parsed.from_number, text=reply_text)
+
+    response = await send_whatsapp_message(parsed.phone_number_id, payload)
+
+    if response.headers.get("content-type", "").startswith("application/json"):
+        logger.info("✅ Reply response: {}", response.json())
+    else:
+        logger.warning("⚠️ Raw response: {}", response.text)
+
+    output = response.json()
+    message_doc = {
+        "input": data,
+        "output": output,
+        "reply_text": reply_text,
+        "version": settings.whatsapp_api_version,
+        "llm": {
+            "source": reply.source,
+            "model": reply.model,
+            "path": reply.path,
+            "prompt_version": reply.prompt_version,
+            "latency": reply.latency,
+            "tokens": reply.tokens,
+        },
+        **message_query_fields(data, output),
+    }
+    if len(fragments) > 1:
+        message_doc["fragments"] = [
+            event.payload["entry"][0]["changes"][0]["value"]["messages"][0]
+            for event in fragments
+        ]
+    reply_id = message_doc["reply_id"]
+
+    increments = {"inbound": len(fragments), "outbound": 1 if reply_id else 0}
+    if reply.source == "llm":
+        increments.update(
+            llm_calls=1, llm_seconds=reply.latency, llm_tokens=reply.tokens
+        )
+    await analytics.record(
+        message_doc["timestamp"], message_doc["phone_number_id"], **increments
+    )
+
+    async def after_insert():
+        # A fast "sent" status can beat the message insert
+        if reply_id:
+            await fold_pending_statuses(database, reply_id)
+
+        event_broker.publish(
+            "message",
+            parsed.from_number,
+            {
+                "incoming_message": parsed.to_model(),
+                "reply_message": parse_reply_message(output, reply_text),
+                "statuses": [],
+            },
+        )
+
+    await write_buffer.add("messages", InsertOne(message_doc), after_insert)
+
+
+async def _record_status(parsed: StatusEvent) -> None:
+    data = parsed.payload
+
+    # Raw statuses stay as an audit log; the listing reads the rollup
+    status_doc = {**data, **status_query_fields(data)}
+    await write_buffer.add("statuses", InsertOne(status_doc))
+    await write_buffer.add(
+        "messages",
+        fold_status_operation(status_doc),
+        after_flush=lambda: _publish_status(parsed, status_doc["recipient_id"]),
+    )
+
+    if status_doc["status"] in ("delivered", "read", "failed"):
+        await analytics.record(
+            status_doc["timestamp"],
+            status_doc["phone_number_id"],
+            **{status_doc["status"]: 1},
+        )
+
+    logger.info(
+        "ℹ️ Status update for message {}: {}",
+        parsed.message_id,
+        parsed.status,
+    )
+
+
+async def _publish_status(parsed: StatusEvent, recipient_id: str) -> None:
+    event_broker.publish("status", recipient_id, parsed.to_model())
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.cache import normalize_text
+from server.logger import logger
+from server.memory import estimate_tokens
+from server.settings import settings
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from have how i if in is it me "
+    "my of on or our so that the there this to we what when where which who "
+    "why will with you your".split()
+)
+FILE_SUFFIXES = (".md", ".txt")
+_HEADING = re.compile(r"^#+\s*(.+)$")
+
+
+def tokenize(text: str) -> list[str]:
+    return [term for term in normalize_text(text).split() if term not in STOPWORDS]
+
+
+@dataclass(slots=True)
+class Chunk:
+    id: str
+    source: str
+    title: str
+    text: str
+    tokens: int
+
+
+def chunk_document(source: str, text: str, max_words: int) -> list[Chunk]:
+    """
+    Splits a document into chunks of whole paragraphs, up to `max_words`
+    each. Markdown headings start a new chunk and become its title.
+    """
+    chunks: list[Chunk] = []
+    title, paragraphs, words = "", [], 0
+
+    def flush():
+        nonlocal paragraphs, words
+        if paragraphs:
+            body = "\n\n".join(paragraphs)
+            text = f"{title}\n{body}" if title else body
+            chunks.append(
+                Chunk(
+                    id=f"{source}#{len(chunks)}",
+                    source=source,
+                    title=title,
+                    text=text,
+                    tokens=estimate_tokens(text),
+                )
+            )
+        paragraphs, words = [], 0
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        heading = _HEADING.match(paragraph.splitlines()[0])
+        if heading:
+            flush()
+            title = heading.group(1).strip()
+            paragraph = "\n".join(paragraph.splitlines()[1:]).strip()
+            if not paragraph:
+                continue
+        count = len(paragraph.split())
+        if paragraphs and words + count > max_words:
+            flush()
+        paragraphs.append(paragraph)
+        words += count
+    flush()
+    return chunks
+
+
+class BM25Index:
+    """
+    In-memory BM25 over chunks, updatable one source at a time.
+
+    Postings are kept per term, and document frequencies are read off them
+    at query time, so adding or removing a source never needs a rebuild.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks: dict[str, Chunk] = {}
+        self.lengths: dict[str, int] = {}
+        self.postings: defaultdict[str, dict[str, int]] = defaultdict(dict)
+        self.by_source: defaultdict[str, list[str]] = defaultdict(list)
+        self.total_length = 0
+
+    def add(self, chunk: Chunk) -> None:
+        terms = Counter(tokenize(chunk.text))
+        self.chunks[chunk.id] = chunk
+        self.lengths[chunk.id] = sum(terms.values())
+        self.total_length += self.lengths[chunk.id]
+        self.by_source[chunk.source].append(chunk.id)
+        for term, count in terms.items():
+            self.postings[term][chunk.id] = count
+
+    def remove_source(self, source: str) -> None:
+        for chunk_id in self.by_source.pop(source, []):
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= self.lengths.pop(chunk_id)
+            for term in set(tokenize(chunk.text)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def search(self, query: str, k: int) -> list[tuple[Chunk, float]]:
+        if not self.chunks:
+            return []
+
+        count = len(self.chunks)
+        average = self.total_length / count or 1
+        scores: defaultdict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                norm = 1 - self.b + self.b * self.lengths[chunk_id] / average
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chunks[chunk_id], score) for chunk_id, score in best]
+
+
+class KnowledgeBase:
+    """
+    Business knowledge retrieved per message instead of sent with every prompt.
+
+    Documents come from text/markdown files in a directory and/or a Mongo
+    collection of `{_id, title, text}` documents. `refresh` reindexes only
+    the documents whose content changed and drops deleted ones.
+    """
+
+    def __init__(
+        self,
+        directory: str | None,
+        collection: str | None,
+        chunk_words: int,
+        top_k: int,
+        min_score: float,
+        max_tokens: int,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.collection = collection
+        self.chunk_words = chunk_words
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_tokens = max_tokens
+        self.index = BM25Index()
+        self.fingerprints: dict[str, str] = {}
+        self.version = ""
+        self.retrievals = 0
+        self.hits = 0
+        self.retrieve_seconds = 0.0
+
+    def upsert(self, source: str, text: str) -> bool:
+        """
+        (Re)indexes one document; False when it is unchanged.
+        """
+        fingerprint = hashlib.sha256(text.encode()).hexdigest()
+        if self.fingerprints.get(source) == fingerprint:
+            return False
+        self.index.remove_source(source)
+        for chunk in chunk_document(source, text, self.chunk_words):
+            self.index.add(chunk)
+        self.fingerprints[source] = fingerprint
+        return True
+
+    def remove(self, source: str) -> None:
+        self.index.remove_source(source)
+        self.fingerprints.pop(source, None)
+
+    async def refresh(self, database: AsyncDatabase | None = None) -> int:
+        """
+        Syncs the index with its sources; returns how many documents changed.
+        """
+        documents: dict[str, str] = {}
+        if self.directory is not None:
+            # File reads stay off the event loop
+            documents.update(await asyncio.to_thread(self._read_directory))
+        if self.collection and database is not None:
+            docs = (
+                await database.get_collection(self.collection)
+                .find({}, {"title": 1, "text": 1})
+                .to_list()
+            )
+            for doc in docs:
+                title, text = doc.get("title"), doc.get("text", "")
+                source = f"mongo:{doc['_id']}"
+                documents[source] = f"# {title}\n\n{text}" if title else text
+
+        changed = sum(self.upsert(source, text) for source, text in documents.items())
+        for source in set(self.fingerprints) - set(documents):
+            self.remove(source)
+            changed += 1
+
+        if changed:
+            self.version = hashlib.sha256(
+                "".join(sorted(self.fingerprints.values())).encode()
+            ).hexdigest()[:16]
+            logger.info(
+                "📚 Knowledge base reindexed: {} documents changed, {} chunks",
+                changed,
+                len(self.index.chunks),
+            )
+        return changed
+
+    def _read_directory(self) -> dict[str, str]:
+        if not self.directory.is_dir():
+            logger.warning("⚠️ Knowledge directory {} not found", self.directory)
+            return {}
+        return {
+            f"file:{path.relative_to(self.directory)}": path.read_text("utf-8")
+            for path in sorted(self.directory.rglob("*"))
+            if path.suffix in FILE_SUFFIXES and path.is_file()
+        }
+
+    def retrieve(self, query: str) -> list[Chunk]:
+        """
+        The best matching chunks for a message, within the token budget.
+        """
+        started = time.perf_counter()
+        chunks, budget = [], self.max_tokens
+        for chunk, score in self.index.search(query, self.top_k):
+            if score < self.min_score or chunk.tokens > budget:
+                continue
+            chunks.append(chunk)
+            budget -= chunk.tokens
+
+        self.retrievals += 1
+        self.hits += bool(chunks)
+        self.retrieve_seconds += time.perf_counter() - started
+        return chunks
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self.fingerprints),
+            "chunks": len(self.index.chunks),
+            "indexed_tokens": sum(c.tokens for c in self.index.chunks.values()),
+            "retrievals": self.retrievals,
+            "hit_rate": self.hits / self.retrievals if self.retrievals else 0.0,
+            "retrieve_seconds": round(self.retrieve_seconds, 3),
+        }
+
+
+knowledge_base = KnowledgeBase(
+    directory=settings.knowledge_dir,
+    collection=settings.knowledge_collection,
+    chunk_words=settings.knowledge_chunk_words,
+    top_k=settings.knowledge_top_k,
+    min_score=settings.knowledge_min_score,
+    max_tokens=settings.knowledge_max_tokens,
+)
@@ -1,14 +1,74 @@
 import os
 
-from langchain_openai import ChatOpenAI
-
 from server.settings import settings
 
-os.environ["OPENAI_API_KEY"] = settings.openai_api_key
+_llm = None
+_fallback_llms = None
+
+
+def get_llm():
+    """
+    Builds the chat model on first use. langchain_openai is slow to import,
+    so it stays out of module import time; the lifespan calls this on boot.
+    """
+    global _llm
+
+    if _llm is None:
+        from langchain_openai import ChatOpenAI
+
+        os.environ["OPENAI_API_KEY"] = settings.openai_api_key
+
+        # Deadlines and retries are handled by the gateway
+        _llm = ChatOpenAI(
+            model=settings.llm_model,
+            verbosity="low",
+            reasoning_effort="low",
+            max_tokens=512,
+            timeout=settings.llm_deadline_seconds,
+            max_retries=0,
+        )
+    return _llm
+
+
+def get_fallback_llms() -> list[tuple[str, object]]:
+    """
+    The models tried, in order, when the primary one fails, from
+    `llm_fallback_models` ("provider:model" names, see `init_chat_model`).
+    """
+    global _fallback_llms
+
+    if _fallback_llms is None:
+        from langchain.chat_models import init_chat_model
+
+        os.environ["OPENAI_API_KEY"] = settings.openai_api_key
+
+        _fallback_llms = [
+            (
+                name,
+                init_chat_model(
+                    name,
+                    max_tokens=512,
+                    timeout=settings.llm_deadline_seconds,
+                    max_retries=0,
+                ),
+            )
+            for name in settings.llm_fallback_models
+        ]
+    return _fallback_llms
+
+
+def llm_chain() -> list[tuple[str, object]]:
+    return [(settings.llm_model, get_llm()), *get_fallback_llms()]
+
+
+def set_llm(llm) -> None:
+    """
+    Swaps in another chat model, e.g. a fake one for benchmarks.
+    """
+    global _llm
+    _llm = llm
+
 
-llm = ChatOpenAI(
-    model="gpt-5-nano",
-    verbosity="low",
-    reasoning_effort="low",
-    max_tokens=512,
-)
+def set_fallback_llms(llms: list[tuple[str, object]]) -> None:
+    global _fallback_llms
+    _fallback_llms = llms
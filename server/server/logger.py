@@ -1,8 +1,13 @@
+import json
 import logging
+import random
+import re
 import sys
 
 from loguru import logger
 
+from server.settings import settings
+
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
 
@@ -29,21 +34,78 @@ class InterceptHandler(logging.Handler):
         )
 
 
+# 11-15 digits: phone numbers and account ids, but not 10 digit unix timestamps
+PHONE_PATTERN = re.compile(r"(?<!\d)\d{11,15}(?!\d)")
+TOKEN_PATTERN = re.compile(
+    r"(Bearer\s+|access_token[=:\"'\s]+|\bEAA)[A-Za-z0-9_\-\.]{8,}", re.IGNORECASE
+)
+
+
+def _mask_phone(match: re.Match) -> str:
+    number = match.group(0)
+    return f"{number[:3]}{'*' * (len(number) - 6)}{number[-3:]}"
+
+
+def redact(text: str) -> str:
+    text = PHONE_PATTERN.sub(_mask_phone, text)
+    return TOKEN_PATTERN.sub(lambda m: f"{m.group(1)}[REDACTED]", text)
+
+
+def _redact_record(record):
+    record["message"] = redact(record["message"])
+
+
+def log_payload(route: str, message: str, payload) -> None:
+    """
+    Logs a (possibly large) payload for `route`, sampled and truncated
+    according to the log_payload_* settings.
+    """
+    rate = settings.log_payload_sample_rates.get(route, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+
+    text = json.dumps(payload, default=str, ensure_ascii=False)
+    limit = settings.log_payload_max_chars
+    if len(text) > limit:
+        text = f"{text[:limit]}… (+{len(text) - limit} chars)"
+    logger.info(message, text)
+
+
+# Variable values in tracebacks are handy locally but leak data in production
+diagnose = (
+    settings.log_diagnose
+    if settings.log_diagnose is not None
+    else settings.environment == "dev"
+)
+
+logger.configure(patcher=_redact_record)
+
 # Intercept standard logging
 logging.basicConfig(handlers=[InterceptHandler()], level=logging.INFO)
 
 # Add stdout handler
-logger.add(
-    sys.stdout,
-    colorize=True,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
-    "<level>{level: <8}</level> | "
-    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
-    "<level>{message}</level>",
-    level="INFO",
-    backtrace=True,
-    diagnose=True,  # show variables in tracebacks
-)
+if settings.log_json:
+    logger.add(
+        sys.stdout,
+        serialize=True,
+        level="INFO",
+        enqueue=settings.log_enqueue,
+        backtrace=True,
+        diagnose=diagnose,
+    )
+else:
+    logger.add(
+        sys.stdout,
+        colorize=True,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
+        "<level>{level: <8}</level> | "
+        "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+        "<level>{message}</level>",
+        level="INFO",
+        enqueue=settings.log_enqueue,
+        backtrace=True,
+        diagnose=diagnose,  # show variables in tracebacks
+    )
 
 
 logger.add(
@@ -52,7 +114,9 @@ logger.add(
     retention="10 days",
     level="DEBUG",
     compression="zip",
-    diagnose=True,
+    serialize=settings.log_json,
+    enqueue=settings.log_enqueue,  # writes happen on a background thread
+    diagnose=diagnose,
     backtrace=True,
 )
 
@@ -1,45 +1,180 @@
 import json
 from contextlib import asynccontextmanager
+from datetime import datetime
 from math import ceil
 from typing import List, Literal
 
 import pymongo
-import uvicorn
-from apscheduler.schedulers.background import BackgroundScheduler
-from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-
-from server.logger import logger
-from server.schemas import MessageWithStatusResponse, PaginatedResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server import analytics
+from server.analytics import Period
+from server.buffer import write_buffer
+from server.cache import reply_cache
+from server.coalesce import coalescer
+from server.db import create_mongo_client, ensure_indexes, get_database
+from server.dedup import Deduplicator, event_key
+from server.events import event_broker
+from server.export import ExportFormat, export_filter, export_messages
+from server.gateway import llm_gateway
+from server.graph import graph_client
+from server.ingest import process_webhook
+from server.knowledge import knowledge_base
+from server.llm import llm_chain
+from server.logger import log_payload, logger
+from server.memory import conversation_memory
+from server.metrics import messages_query_seconds, registry
+from server.pagination import (
+    CountCache,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+)
+from server.schemas import (
+    MessageWithStatusResponse,
+    PaginatedResponse,
+    StatsBucket,
+)
+from server.search import SearchMode, build_search_filter
 from server.settings import settings
+from server.stall import StallDetector
+from server.startup import StartupTimer
+from server.state import LeaderElection, create_state_backend
+from server.statuses import parse_status_summary
 from server.utils import (
-    build_reply_message,
-    generate_reply,
     parse_incoming_message,
     parse_reply_message,
-    parse_status,
-    parse_whatsapp_webhook,
     ping_self,
-    send_whatsapp_message,
 )
+from server.webhook import decode_json, iter_events
+from server.worker import WebhookJob, WebhookQueue, spill
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start scheduler
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(ping_self, "interval", minutes=5)  # every 10 min
-    scheduler.start()
+    timer = StartupTimer()
+
+    if settings.stall_detector_enabled:
+        app.state.stall_detector = StallDetector(settings.stall_threshold_seconds)
+        app.state.stall_detector.start()
+
+    # Heavy components are built here rather than at import time
+    with timer.phase("llm"):
+        llm_chain()
+
+    graph_client.start()
+    logger.info("Graph API client started")
+
+    # One pooled client for the app lifetime
+    with timer.phase("mongo"):
+        app.state.mongo_client = create_mongo_client()
+        logger.info("MongoDB client created")
+        database = app.state.mongo_client.get_database(settings.mongo_database)
+
+    # Coordination state shared by every worker process
+    app.state.state_backend = create_state_backend(settings.state_backend, database)
+    app.state.deduplicator = Deduplicator(
+        app.state.state_backend,
+        maxsize=settings.dedup_cache_size,
+        memory_ttl_seconds=settings.dedup_memory_ttl_seconds,
+        store_ttl_seconds=settings.dedup_store_ttl_seconds,
+    )
+    reply_cache.shared = app.state.state_backend
+    graph_client.state = app.state.state_backend
+
+    if settings.knowledge_enabled:
+        with timer.phase("knowledge"):
+            await knowledge_base.refresh(database)
+
+    with timer.phase("indexes"):
+        await app.state.state_backend.ensure_indexes()
+        await ensure_indexes(database)
+        await analytics.ensure_indexes(database)
+
+    write_buffer.start(database)
+
+    # Only the lease holder runs scheduled jobs; the others keep renewing
+    # so one takes over if the leader dies
+    with timer.phase("scheduler"):
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+        app.state.leader = LeaderElection(
+            app.state.state_backend, "scheduler", settings.leader_lease_seconds
+        )
+        scheduler = AsyncIOScheduler()
+        scheduler.add_job(
+            app.state.leader.renewer(),
+            "interval",
+            seconds=settings.leader_lease_seconds / 3,
+            next_run_time=datetime.now(),
+        )
+        scheduler.add_job(
+            app.state.leader.run_if_leader(ping_self), "interval", minutes=5
+        )
+        if settings.knowledge_enabled:
+            # Every worker keeps its own index
+            scheduler.add_job(
+                knowledge_base.refresh,
+                "interval",
+                seconds=settings.knowledge_refresh_seconds,
+                args=[database],
+            )
+        scheduler.start()
     logger.info("Scheduler started")
 
+    if settings.webhook_mode == "queue":
+        app.state.webhook_queue = WebhookQueue(
+            database=database,
+            handler=process_webhook,
+            maxsize=settings.webhook_queue_maxsize,
+            workers=settings.webhook_workers,
+            overflow=settings.webhook_overflow,
+        )
+        app.state.webhook_queue.start()
+
+    timer.report()
+
     yield
 
-    scheduler.shutdown()
+    # First, so no leader job is left running against a closed Mongo client.
+    # shutdown() does not wait for coroutine jobs, the leader tracks its own
+    scheduler.shutdown(wait=False)
+    await app.state.leader.stop(timeout=settings.webhook_drain_timeout_seconds)
     logger.info("Scheduler stopped")
 
+    if settings.webhook_mode == "queue":
+        await app.state.webhook_queue.stop(
+            timeout=settings.webhook_drain_timeout_seconds
+        )
+
+    # Coalesced turns run outside the workers. They were already acknowledged,
+    # so unfinished ones are spilled rather than lost
+    unfinished = await coalescer.drain(timeout=settings.webhook_drain_timeout_seconds)
+    for event in unfinished:
+        await spill(database, event.payload)
+    if unfinished:
+        logger.warning("⚠️ Spilled {} unfinished coalesced messages", len(unfinished))
+
+    # After the workers, so their last writes are included
+    await write_buffer.stop()
+
+    await app.state.mongo_client.close()
+    logger.info("MongoDB client closed")
+
+    await graph_client.aclose()
+    logger.info("Graph API client closed")
+
+    if settings.stall_detector_enabled:
+        await app.state.stall_detector.stop()
+
+    # Flush the background log writer
+    await logger.complete()
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -74,73 +209,122 @@ async def verify_webhook(request: Request):
 
 
 @app.post("/webhook")
-async def receive_webhook(request: Request):
+async def receive_webhook(
+    request: Request, database: AsyncDatabase = Depends(get_database)
+):
     """
     Handles WhatsApp messages (POST).
     """
 
-    data = await request.json()
+    data = decode_json(await request.body())
 
-    logger.info("🔔 Webhook received: {}", data)
-    # logger.info("🔔 Webhook received:\n{}", json.dumps(data, indent=2))
+    log_payload("webhook", "🔔 Webhook received: {}", data)
 
     try:
-        mongo_client = MongoClient(settings.mongo_uri)
-
-        database = mongo_client.get_database("bellerouze_chatbot")
+        # Meta may batch several messages or statuses into one delivery
+        events = list(iter_events(data))
 
-        logger.debug("Inserted message into MongoDB")
-
-        parsed = parse_whatsapp_webhook(data)
-
-        if not parsed:
+        if not events:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Message not parsed"
             )
 
-        if parsed.type == "message":
-            reply_text = await generate_reply(parsed.incoming_message)
-            payload = build_reply_message(to=parsed.from_number, text=reply_text)
+        deduplicator = request.app.state.deduplicator
+        duplicates = 0
+        for event in events:
+            key = event_key(event)
+            try:
+                claimed = not key or await deduplicator.claim(key)
+            except Exception as e:
+                # The delivery would be lost on a 200; Meta redelivers a 5xx,
+                # and events already accepted dedupe on retry
+                logger.exception(f"❌ Dedup claim failed for {key}: {str(e)}")
+                return JSONResponse(
+                    content={"status": "unavailable"},
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "5"},
+                )
+            if not claimed:
+                logger.info("🔁 Duplicate webhook ignored: {}", key)
+                duplicates += 1
+                continue
+
+            if settings.webhook_mode == "queue":
+                accepted = await request.app.state.webhook_queue.submit(
+                    WebhookJob(event=event)
+                )
+                if not accepted:
+                    if key:
+                        await deduplicator.release(key)
+                    # Meta retries non-2xx deliveries, so this is safe
+                    # backpressure; events already accepted dedupe on retry
+                    return JSONResponse(
+                        content={"status": "busy"},
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        headers={"Retry-After": "5"},
+                    )
+            else:
+                await process_webhook(database, event)
 
-            response = await send_whatsapp_message(parsed.phone_number_id, payload)
+        if duplicates == len(events):
+            return JSONResponse(content={"status": "duplicate"})
 
-            if response.headers.get("content-type", "").startswith("application/json"):
-                # logger.info(
-                #     "✅ Reply response:\n{}", json.dumps(response.json(), indent=2)
-                # )
-                logger.info("✅ Reply response: {}", response.json())
-            else:
-                logger.warning("⚠️ Raw response: {}", response.text)
-
-            messages_collection = database.get_collection("messages")
-            messages_collection.insert_one(
-                {
-                    "input": data,
-                    "output": response.json(),
-                    "reply_text": reply_text,
-                    "version": settings.whatsapp_api_version,
-                }
-            )
+    except Exception as e:
+        logger.exception(f"❌ Error processing webhook: {str(e)}")
 
-        elif parsed.type == "status":
-            statuses_collection = database.get_collection("statuses")
-            statuses_collection.insert_one(data)
+    return JSONResponse(content={"status": "received"})
 
-            logger.info(
-                "ℹ️ Status update for message {}: {}",
-                parsed.message_id,
-                parsed.status,
-            )
 
-        else:
-            logger.warning("⚠️ Unknown webhook type: {}", parsed.type)
+def component_stats() -> dict[str, dict]:
+    stats = {
+        "reply_cache": reply_cache.stats(),
+        "memory": conversation_memory.stats(),
+        "write_buffer": write_buffer.stats(),
+        "events": event_broker.stats(),
+        "coalescer": coalescer.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "knowledge": knowledge_base.stats(),
+    }
+    # Lifespan-owned components only exist once the app has started
+    if hasattr(app.state, "deduplicator"):
+        stats["dedup"] = app.state.deduplicator.stats()
+    if hasattr(app.state, "webhook_queue"):
+        stats["queue"] = app.state.webhook_queue.stats()
+    return stats
 
-        mongo_client.close()
 
-    except Exception as e:
-        logger.exception(f"❌ Error processing webhook: {str(e)}")
+registry.add_collector(component_stats)
 
-    return JSONResponse(content={"status": "received"})
+
+@app.get("/webhook/stats")
+async def get_webhook_stats():
+    """
+    Dedup, reply cache, memory, coalescing, LLM gateway, knowledge base, write
+    buffer and queue counters.
+    """
+    return component_stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+count_cache = CountCache(ttl_seconds=settings.messages_count_cache_ttl_seconds)
+
+
+# Public sort names (and the legacy raw paths) mapped to indexed top-level fields
+SORT_FIELDS = {
+    "timestamp": "timestamp",
+    "input.entry.0.changes.0.value.messages.0.timestamp": "timestamp",
+    "wa_id": "wa_id",
+    "input.entry.0.changes.0.value.contacts.0.wa_id": "wa_id",
+}
 
 
 @app.get("/messages", response_model=PaginatedResponse[MessageWithStatusResponse])
@@ -151,8 +335,9 @@ async def get_messages_with_statuses(
     page: int = Query(1, ge=0, description="Number of records to skip"),
     size: int = Query(20, ge=1, le=100, description="Max number of records to return"),
     sort_field: str = Query(
-        "input.entry.0.changes.0.value.messages.0.timestamp",
-        description="Field to sort by",
+        "timestamp",
+        description="Field to sort by: "
+        + ", ".join(sorted(set(SORT_FIELDS) | {"relevance"})),
     ),
     sort_order: Literal["asc", "desc"] = Query(
         "desc", description="Sort order: 'asc' or 'desc'"
@@ -160,116 +345,251 @@ async def get_messages_with_statuses(
     search: str | None = Query(
         default=None, description="Search text (matches phone or message content)"
     ),
+    search_mode: SearchMode = Query(
+        "text",
+        description="'text' uses the full-text index, "
+        "'substring' matches the literal text",
+    ),
+    pagination: Literal["page", "cursor"] = Query(
+        "page", description="'page' uses page/size, 'cursor' uses keyset cursors"
+    ),
+    cursor: str | None = Query(
+        default=None, description="next_cursor or prev_cursor from a previous response"
+    ),
+    count: Literal["exact", "cached", "estimated"] = Query(
+        "exact", description="How `total` is computed"
+    ),
+    database: AsyncDatabase = Depends(get_database),
 ):
-    try:
-        mongo_client = MongoClient(settings.mongo_uri)
-        database = mongo_client.get_database("bellerouze_chatbot")
-        collection = database.get_collection("messages")
+    with messages_query_seconds.time(pagination=pagination):
+        try:
+            collection = database.get_collection("messages")
 
-        parsed = []
+            parsed = []
 
-        base_filter = {}
+            base_filter = {}
 
-        if phone_number:
-            base_filter["input.entry.0.changes.0.value.contacts.0.wa_id"] = phone_number
-
-        if search:
-            base_filter["$or"] = [
-                {
-                    "input.entry.0.changes.0.value.contacts.0.wa_id": {
-                        "$regex": search,
-                        "$options": "i",
-                    }
-                },
-                {
-                    "input.entry.0.changes.0.value.messages.0.text.body": {
-                        "$regex": search,
-                        "$options": "i",
-                    }
-                },
-                {"reply_text": {"$regex": search, "$options": "i"}},
-            ]
+            if phone_number:
+                base_filter["wa_id"] = phone_number
 
-        total = collection.count_documents(base_filter)
+            search_filter = build_search_filter(search, search_mode) if search else {}
+            is_text_search = "$text" in search_filter
 
-        skip = (page - 1) * size
-        pages = ceil(total / size) if total > 0 else 1
+            if search_filter:
+                base_filter = (
+                    {"$and": [base_filter, search_filter]}
+                    if base_filter
+                    else search_filter
+                )
 
-        pymongo_sort_order = (
-            pymongo.ASCENDING if sort_order == "asc" else pymongo.DESCENDING
-        )
+            if count == "estimated" and not base_filter:
+                total = await collection.estimated_document_count()
+            elif count == "exact":
+                total = await collection.count_documents(base_filter)
+            else:
+                total = await count_cache.count(collection, base_filter)
 
-        pipeline = []
+            pages = ceil(total / size) if total > 0 else 1
 
-        if phone_number:
-            pipeline.append(
-                {
-                    "$match": {
-                        "input.entry.0.changes.0.value.contacts.0.wa_id": phone_number
-                    }
-                }
+            pymongo_sort_order = (
+                pymongo.ASCENDING if sort_order == "asc" else pymongo.DESCENDING
             )
 
-        pipeline.extend(
-            [
-                {
-                    "$lookup": {
-                        "from": "statuses",
-                        "localField": "output.messages.id",
-                        "foreignField": "entry.changes.value.statuses.id",
-                        "as": "statuses",
+            if sort_field == "relevance":
+                if not is_text_search or pagination == "cursor":
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Relevance sort needs a text search in page mode",
+                    )
+                sort_key = "score"
+                sort = [
+                    ("score", {"$meta": "textScore"}),
+                    ("timestamp", pymongo.DESCENDING),
+                ]
+            else:
+                sort_key = SORT_FIELDS.get(sort_field)
+                if sort_key is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Unsupported sort field: {sort_field}",
+                    )
+                sort = [(sort_key, pymongo_sort_order), ("_id", pymongo_sort_order)]
+
+            next_cursor = prev_cursor = None
+
+            if pagination == "cursor":
+                query = base_filter
+                backwards = False
+
+                if cursor:
+                    try:
+                        sort_value, cursor_id, direction = decode_cursor(cursor)
+                    except InvalidCursor as e:
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+                        )
+                    backwards = direction == "prev"
+                    # Walking forward in ascending order means greater values
+                    forward = (sort_order == "asc") != backwards
+                    query = {
+                        "$and": [
+                            base_filter,
+                            keyset_filter(sort_key, sort_value, cursor_id, forward),
+                        ]
                     }
-                },
-                {"$sort": {sort_field: pymongo_sort_order}},
-                {"$skip": skip},
-                {"$limit": size},
-            ]
-        )
-
-        raw_docs = collection.aggregate(pipeline)
 
-        for raw in raw_docs:
-            input = raw["input"]
-            output = raw["output"]
-            reply_text = raw["reply_text"]
-            statuses = raw["statuses"]
+                walk_order = -pymongo_sort_order if backwards else pymongo_sort_order
+                docs = (
+                    await collection.find(query)
+                    .sort([(sort_key, walk_order), ("_id", walk_order)])
+                    .limit(size + 1)
+                    .to_list()
+                )
+
+                has_more = len(docs) > size
+                docs = docs[:size]
+                if backwards:
+                    docs.reverse()
+
+                has_prev = has_more if backwards else cursor is not None
+                has_next = True if backwards else has_more
+
+                if docs:
+                    first, last = docs[0], docs[-1]
+                    if has_prev:
+                        prev_cursor = encode_cursor(
+                            first[sort_key], first["_id"], "prev"
+                        )
+                    if has_next:
+                        next_cursor = encode_cursor(last[sort_key], last["_id"], "next")
 
-            parsed_input = parse_incoming_message(input)
-            parsed_output = parse_reply_message(output, reply_text)
+            else:
+                skip = (page - 1) * size
+                projection = (
+                    {"score": {"$meta": "textScore"}} if is_text_search else None
+                )
+                docs = (
+                    await collection.find(base_filter, projection)
+                    .sort(sort)
+                    .skip(skip)
+                    .limit(size)
+                    .to_list()
+                )
+
+            for raw in docs:
+                input = raw["input"]
+                output = raw["output"]
+                reply_text = raw["reply_text"]
+
+                parsed_input = parse_incoming_message(input)
+                parsed_output = parse_reply_message(output, reply_text)
+                parsed_statuses = parse_status_summary(
+                    parsed_output.message_id, raw.get("status_summary")
+                )
+
+                parsed.append(
+                    {
+                        "incoming_message": parsed_input,
+                        "reply_message": parsed_output,
+                        "statuses": parsed_statuses,
+                    }
+                )
+
+            response = {
+                "items": parsed,
+                "total": total,
+                "page": page,
+                "size": size,
+                "pages": pages,
+                "next_cursor": next_cursor,
+                "prev_cursor": prev_cursor,
+            }
+
+            return JSONResponse(content=jsonable_encoder(response))
+
+        except HTTPException:
+            raise
+
+        except Exception as e:
+            return JSONResponse(
+                content={"error": f"Failed to fetch messages: {str(e)}"},
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
 
-            parsed_statuses = []
-            for status_item in statuses:
-                parsed_status = parse_status(status_item)
-                parsed_statuses.append(parsed_status)
 
-            parsed.append(
-                {
-                    "incoming_message": parsed_input,
-                    "reply_message": parsed_output,
-                    "statuses": parsed_statuses,
-                }
-            )
+@app.get("/stats", response_model=List[StatsBucket])
+async def get_stats(
+    period: Period = Query("day", description="'day' or 'month'"),
+    start: str | None = Query(
+        default=None, description="First bucket, e.g. 2025-09-01 or 2025-09"
+    ),
+    end: str | None = Query(
+        default=None, description="Last bucket, e.g. 2025-09-30 or 2025-09"
+    ),
+    phone_number_id: str | None = Query(default=None),
+    database: AsyncDatabase = Depends(get_database),
+):
+    """
+    Message counts and LLM usage per day or month, from precomputed rollups.
+    """
+    return await analytics.query_stats(database, period, start, end, phone_number_id)
 
-        mongo_client.close()
 
-        response = {
-            "items": parsed,
-            "total": total,
-            "page": page,
-            "size": size,
-            "pages": pages,
-        }
+@app.get("/events")
+async def stream_events(
+    phone_number: str | None = Query(
+        default=None, description="Only events for this phone number"
+    ),
+):
+    """
+    Server-sent events for new messages (`message`) and status changes
+    (`status`). A `resync` event means some events were dropped and the
+    viewer should refetch.
+    """
+    subscription = event_broker.subscribe(phone_number)
+    return StreamingResponse(
+        event_broker.stream(subscription, settings.events_heartbeat_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        return JSONResponse(content=jsonable_encoder(response))
 
-    except Exception as e:
-        return JSONResponse(
-            content={"error": f"Failed to fetch messages: {str(e)}"},
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        )
+@app.get("/messages/export")
+async def export_messages_stream(
+    format: ExportFormat = Query("ndjson", description="'ndjson' or 'csv'"),
+    start: datetime | None = Query(
+        default=None,
+        description="Include messages from this time (ISO 8601, UTC if no offset)",
+    ),
+    end: datetime | None = Query(
+        default=None,
+        description="Include messages before this time (ISO 8601, UTC if no offset)",
+    ),
+    phone_number: str | None = Query(
+        default=None, description="The phone number without the  e.g 254712345678"
+    ),
+    database: AsyncDatabase = Depends(get_database),
+):
+    """
+    Streams message history as NDJSON or CSV with constant memory.
+    """
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"messages.{'csv' if format == 'csv' else 'ndjson'}"
+
+    return StreamingResponse(
+        export_messages(
+            database.get_collection("messages"),
+            export_filter(start, end, phone_number),
+            format,
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "server.main:app",  # Your FastAPI app
         host="0.0.0.0",
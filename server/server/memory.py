@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.settings import settings
+
+
+@dataclass(slots=True)
+class Turn:
+    user: str
+    assistant: str
+    timestamp: float
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """
+    Recent turns per wa_id, kept in an LRU so the hot path never waits on Mongo.
+
+    A conversation is loaded from the `messages` collection once, the first
+    time its wa_id is seen, and is appended to in memory after that. Turns
+    older than the session TTL are forgotten.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int,
+        max_turns: int,
+        max_tokens: int,
+        session_ttl_seconds: float,
+    ):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.session_ttl_seconds = session_ttl_seconds
+        self.conversations: OrderedDict[str, deque[Turn]] = OrderedDict()
+        self.loads = 0
+
+    async def history(self, database: AsyncDatabase, wa_id: str) -> list[Turn]:
+        turns = self.conversations.get(wa_id)
+        if turns is None:
+            turns = await self._load(database, wa_id)
+            self._store(wa_id, turns)
+        else:
+            self.conversations.move_to_end(wa_id)
+
+        cutoff = time.time() - self.session_ttl_seconds
+        while turns and turns[0].timestamp < cutoff:
+            turns.popleft()
+        return list(turns)
+
+    def append(self, wa_id: str, user: str, assistant: str, timestamp: float) -> None:
+        turns = self.conversations.get(wa_id)
+        if turns is None:
+            turns = deque(maxlen=self.max_turns)
+            self._store(wa_id, turns)
+        turns.append(Turn(user=user, assistant=assistant, timestamp=timestamp))
+        self.conversations.move_to_end(wa_id)
+
+    def to_messages(self, turns: list[Turn]) -> list[BaseMessage]:
+        """
+        Newest turns that fit the token budget, oldest first. Turns that don't
+        fit are reduced to a one-line recap of what the customer asked.
+        """
+        kept: list[Turn] = []
+        budget = self.max_tokens
+        for turn in reversed(turns):
+            cost = estimate_tokens(turn.user) + estimate_tokens(turn.assistant)
+            if cost > budget:
+                break
+            kept.append(turn)
+            budget -= cost
+        kept.reverse()
+
+        messages: list[BaseMessage] = []
+        dropped = turns[: len(turns) - len(kept)]
+        if dropped:
+            recap = "; ".join(turn.user[:80] for turn in dropped)
+            if estimate_tokens(recap) <= budget:
+                messages.append(HumanMessage(content=f"(Earlier I asked: {recap})"))
+
+        for turn in kept:
+            messages.append(HumanMessage(content=turn.user))
+            messages.append(AIMessage(content=turn.assistant))
+        return messages
+
+    async def _load(self, database: AsyncDatabase, wa_id: str) -> deque[Turn]:
+        self.loads += 1
+        cutoff = int(time.time() - self.session_ttl_seconds)
+        docs = (
+            await database.get_collection("messages")
+            .find(
+                {"wa_id": wa_id, "timestamp": {"$gte": cutoff}},
+                {"text": 1, "reply_text": 1, "timestamp": 1},
+            )
+            .sort([("timestamp", -1), ("_id", -1)])
+            .limit(self.max_turns)
+            .to_list()
+        )
+        docs.reverse()
+        return deque(
+            (
+                Turn(
+                    user=doc.get("text", ""),
+                    assistant=doc.get("reply_text", ""),
+                    timestamp=doc["timestamp"],
+                )
+                for doc in docs
+            ),
+            maxlen=self.max_turns,
+        )
+
+    def _store(self, wa_id: str, turns: deque[Turn]) -> None:
+        self.conversations[wa_id] = turns
+        while len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"conversations": len(self.conversations), "loads": self.loads}
+
+
+conversation_memory = ConversationMemory(
+    max_conversations=settings.memory_max_conversations,
+    max_turns=settings.memory_max_turns,
+    max_tokens=settings.memory_max_tokens,
+    session_ttl_seconds=settings.memory_session_ttl_seconds,
+)
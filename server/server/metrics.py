@@ -0,0 +1,233 @@
+import math
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from pymongo import monitoring
+
+PREFIX = "bellerouze_"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: defaultdict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self.values[self._key(labels)] += amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}"
+            for key, v in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.values[self._key(labels)] -= amount
+
+    @contextmanager
+    def track(self, **labels):
+        """
+        Counts the block as in flight while it runs.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts: dict[LabelValues, list[int]] = {}
+        self.sums: defaultdict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * len(self.buckets)
+        # Per-bucket counts; made cumulative at render time
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the block's duration. Labels can be changed inside the block
+        (e.g. to record the outcome) by mutating the yielded dict.
+        """
+        labels = dict(labels)
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.label_names, key, le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self.sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the process metrics and renders them in the Prometheus text format.
+
+    Collectors are callables returning `{component: stats_dict}`; their
+    numeric values are exposed as gauges at scrape time, so existing
+    `stats()` methods don't need any hot-path instrumentation.
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], dict[str, dict]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], dict[str, dict]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        for collector in self.collectors:
+            for component, stats in collector().items():
+                for key, value in stats.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    name = f"{PREFIX}{component}_{key}"
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+llm_seconds = registry.register(
+    Histogram("llm_request_seconds", "LLM call duration", ["model", "outcome"])
+)
+llm_in_flight = registry.register(Gauge("llm_in_flight", "LLM calls in progress"))
+llm_prompt_tokens = registry.register(
+    Counter(
+        "llm_prompt_tokens_total",
+        "Estimated prompt tokens sent, by section and prompt version",
+        ["section", "version"],
+    )
+)
+llm_replies = registry.register(
+    Counter(
+        "llm_replies_total", "Replies by the path that served them", ["path", "model"]
+    )
+)
+llm_tokens = registry.register(
+    Counter("llm_tokens_total", "LLM tokens used", ["kind"])
+)
+
+graph_seconds = registry.register(
+    Histogram("graph_request_seconds", "Graph API request duration", ["status"])
+)
+graph_in_flight = registry.register(
+    Gauge("graph_in_flight", "Graph API requests in progress")
+)
+graph_retries = registry.register(
+    Counter("graph_retries_total", "Graph API retries", ["reason"])
+)
+
+mongo_seconds = registry.register(
+    Histogram("mongo_command_seconds", "MongoDB command duration", ["command"])
+)
+mongo_failures = registry.register(
+    Counter("mongo_command_failures_total", "Failed MongoDB commands", ["command"])
+)
+
+webhook_seconds = registry.register(
+    Histogram("webhook_processing_seconds", "Webhook processing time", ["type"])
+)
+messages_query_seconds = registry.register(
+    Histogram("messages_query_seconds", "/messages query time", ["pagination"])
+)
+
+errors = registry.register(
+    Counter("errors_total", "Errors by component and type", ["component", "type"])
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every command the Mongo client sends, by command name.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        mongo_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_failures.inc(command=event.command_name)
@@ -0,0 +1,95 @@
+"""
+One-shot data migrations.
+
+Run with `python -m server.migrations`.
+"""
+
+import asyncio
+
+from pymongo import UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.analytics import rebuild_rollups
+from server.db import create_mongo_client, ensure_indexes
+from server.logger import logger
+from server.settings import settings
+from server.statuses import fold_status
+from server.utils import message_query_fields, status_query_fields
+
+BATCH_SIZE = 500
+
+
+async def _backfill(
+    database: AsyncDatabase, collection_name: str, missing_field: str, build
+) -> int:
+    collection = database.get_collection(collection_name)
+    updated = 0
+    batch = []
+
+    async for doc in collection.find({missing_field: {"$exists": False}}):
+        try:
+            fields = build(doc)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning("⚠️ Skipping {} {}: {}", collection_name, doc["_id"], e)
+            continue
+
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(batch) >= BATCH_SIZE:
+            result = await collection.bulk_write(batch, ordered=False)
+            updated += result.modified_count
+            batch = []
+
+    if batch:
+        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+
+    return updated
+
+
+async def backfill_query_fields(database: AsyncDatabase) -> None:
+    """
+    Adds the flattened query fields to documents stored before they existed.
+    """
+    messages = await _backfill(
+        database,
+        "messages",
+        "text",
+        lambda doc: message_query_fields(doc["input"], doc.get("output")),
+    )
+    logger.info("Backfilled {} messages", messages)
+
+    statuses = await _backfill(
+        database, "statuses", "timestamp", status_query_fields
+    )
+    logger.info("Backfilled {} statuses", statuses)
+
+
+async def backfill_status_summaries(database: AsyncDatabase) -> None:
+    """
+    Folds every stored status into its message's status_summary.
+    """
+    messages = database.get_collection("messages")
+    folded = 0
+
+    async for status_doc in database.get_collection("statuses").find(
+        {"message_id": {"$exists": True}}
+    ):
+        if await fold_status(messages, status_doc):
+            folded += 1
+
+    logger.info("Folded {} statuses into messages", folded)
+
+
+async def main():
+    mongo_client = create_mongo_client()
+    try:
+        database = mongo_client.get_database(settings.mongo_database)
+        await backfill_query_fields(database)
+        await backfill_status_summaries(database)
+        await rebuild_rollups(database)
+        await ensure_indexes(database)
+    finally:
+        await mongo_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
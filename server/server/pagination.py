@@ -0,0 +1,71 @@
+import base64
+import json
+import time
+from typing import Any, Literal
+
+from bson import ObjectId
+from pymongo.asynchronous.collection import AsyncCollection
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value: Any, _id: ObjectId, direction: Literal["next", "prev"]) -> str:
+    """
+    Opaque cursor pointing just after (or before) a document in sort order.
+    """
+    raw = json.dumps({"v": sort_value, "id": str(_id), "d": direction})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Any, ObjectId, Literal["next", "prev"]]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded))
+        direction = raw["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return raw["v"], ObjectId(raw["id"]), direction
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(sort_key: str, sort_value: Any, _id: ObjectId, forward: bool) -> dict:
+    """
+    Documents strictly after (sort_value, _id) when `forward`, strictly before otherwise.
+    """
+    op = "$gt" if forward else "$lt"
+    return {
+        "$or": [
+            {sort_key: {op: sort_value}},
+            {sort_key: sort_value, "_id": {op: _id}},
+        ]
+    }
+
+
+class CountCache:
+    """
+    Short-lived cache of count_documents results keyed by filter.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self.entries: dict[str, tuple[float, int]] = {}
+
+    async def count(self, collection: AsyncCollection, query: dict) -> int:
+        key = f"{collection.name}:{json.dumps(query, sort_keys=True, default=str)}"
+        now = time.monotonic()
+
+        cached = self.entries.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        total = await collection.count_documents(query)
+        if len(self.entries) >= self.maxsize:
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+            if len(self.entries) >= self.maxsize:
+                self.entries.clear()
+        self.entries[key] = (now + self.ttl_seconds, total)
+        return total
@@ -1,28 +1,33 @@
-from datetime import datetime
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 
-today_str = datetime.now().strftime("%d %B %Y")
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-SYSTEM_PROMPT = f"""
-System Prompt – Bellerouze Outfitters Customer Service Bot
+from server.memory import estimate_tokens
+from server.settings import settings
 
-xYou are Bellerouze Outfitters’ customer service assistant. You provide factual, concise information about the company only.
+# Bump on every change to SECTIONS
+PROMPT_VERSION = 2
 
-Today's Date: {today_str}
+# Static, in order. Nothing here may depend on the date or the customer,
+# so the rendered prefix stays byte-identical and provider-cacheable.
+SECTIONS = {
+    "role": """System Prompt – Bellerouze Outfitters Customer Service Bot
 
-Business Info:
+You are Bellerouze Outfitters’ customer service assistant. You provide factual, concise information about the company only.""",
+    "business_info": """Business Info:
 Name: Bellerouze Outfitters
 Location: Space Apartments, Mai Mahiu Rd, Nairobi
 Website: https://bellerouze.com/
 Email: outfits@bellerouze.com
-Phone: +254 111 056 090
-
-Opening Hours:
+Phone: +254 111 056 090""",
+    "hours": """Opening Hours:
 Mon–Fri: 6 am – 7 pm
-Sat–Sun: 9 am – 6 pm
-
-Services: Embroidery, Uniforms, Stationery, Books
-
-Instructions:
+Sat–Sun: 9 am – 6 pm""",
+    "services": """Services: Embroidery, Uniforms, Stationery, Books""",
+    "instructions": """Instructions:
 
 Answer only questions related to Bellerouze Outfitters’ location, contacts, opening hours, services, and general info.
 
@@ -31,5 +36,90 @@ If asked about purchases, direct the customer to our website or provide contact
 Do not give personal opinions or discuss unrelated topics.
 
 If a question is out of scope, reply:
-"I’m sorry, I can only help with questions related to Bellerouze Outfitters. You can visit our website at https://bellerouze.com/ for more information."
-"""
\ No newline at end of file
+"I’m sorry, I can only help with questions related to Bellerouze Outfitters. You can visit our website at https://bellerouze.com/ for more information.\"""",
+}
+
+
+@dataclass(slots=True)
+class Prompt:
+    messages: list[BaseMessage]
+    version: str
+    # Identifies everything but the customer's own words, for the reply cache
+    cache_key: str
+    tokens: dict[str, int]
+
+
+class PromptBuilder:
+    """
+    Assembles the messages for one LLM call.
+
+    The static sections form the first system message, identical on every
+    call. Volatile fields (today's date in the business timezone, customer
+    context, knowledge base passages) go in a second system message after the
+    history, right before the customer's message. The date message is
+    rendered once per day.
+    """
+
+    def __init__(self, sections: dict[str, str], version: int, timezone: str):
+        self.static = "\n\n".join(sections.values())
+        digest = hashlib.sha256(self.static.encode()).hexdigest()[:8]
+        # The digest catches edits made without a version bump
+        self.version = f"v{version}-{digest}"
+        self.static_message = SystemMessage(content=self.static)
+        self.section_tokens = {
+            name: estimate_tokens(text) for name, text in sections.items()
+        }
+        self.timezone = ZoneInfo(timezone)
+        self.day: date | None = None
+        self.day_text = ""
+        self.day_message: SystemMessage | None = None
+
+    def _today(self) -> str:
+        today = datetime.now(self.timezone).date()
+        if today != self.day:
+            self.day = today
+            self.day_text = f"Today's Date: {today:%A %d %B %Y}"
+            self.day_message = SystemMessage(content=self.day_text)
+        return self.day_text
+
+    def build(
+        self,
+        user_message: str,
+        history: list[BaseMessage] | None = None,
+        context: dict[str, str] | None = None,
+        knowledge: list[str] | None = None,
+        knowledge_version: str = "",
+    ) -> Prompt:
+        day_text = self._today()
+        lines = [
+            f"{name}: {value}" for name, value in (context or {}).items() if value
+        ]
+        if knowledge:
+            lines.append("Relevant information:\n\n" + "\n\n".join(knowledge))
+        if lines:
+            volatile = SystemMessage(content="\n".join([day_text, *lines]))
+        else:
+            volatile = self.day_message
+
+        history = history or []
+        tokens = {
+            **self.section_tokens,
+            "volatile": estimate_tokens(volatile.content),
+            "knowledge": sum(estimate_tokens(text) for text in knowledge or ()),
+            "history": sum(estimate_tokens(str(m.content)) for m in history),
+            "user": estimate_tokens(user_message),
+        }
+        return Prompt(
+            messages=[
+                self.static_message,
+                *history,
+                volatile,
+                HumanMessage(content=user_message),
+            ],
+            version=self.version,
+            cache_key=f"{self.static}\n\n{day_text}\n\n{knowledge_version}",
+            tokens=tokens,
+        )
+
+
+prompt_builder = PromptBuilder(SECTIONS, PROMPT_VERSION, settings.prompt_timezone)
@@ -12,6 +12,7 @@ class IncomingMessage(BaseModel):
     type: Literal["message"]
     from_number: str
     incoming_message: str
+    message_id: Optional[str] = None
 
 
 class ReplyMessage(BaseModel):
@@ -27,6 +28,7 @@ class StatusUpdate(BaseModel):
     status: str
     message_id: str
     recipient_id: str
+    errors: Optional[List[dict]] = None
 
 
 class MessageWithStatusResponse(BaseModel):
@@ -41,3 +43,19 @@ class PaginatedResponse(BaseModel, Generic[T]):
     page: int
     size: int
     pages: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class StatsBucket(BaseModel):
+    period: Literal["day", "month"]
+    bucket: str
+    phone_number_id: str
+    inbound: int
+    outbound: int
+    delivered: int
+    read: int
+    failed: int
+    llm_calls: int
+    llm_seconds: float
+    llm_tokens: int
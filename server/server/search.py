@@ -0,0 +1,54 @@
+import re
+from typing import Literal
+
+PHONE_PATTERN = re.compile(r"\+?[\d\s-]+")
+# Shorter numbers (amounts, years, sizes) are searched for in message text
+MIN_PHONE_DIGITS = 7
+
+SearchMode = Literal["text", "substring"]
+
+
+def phone_prefix(search: str) -> str | None:
+    """
+    Digits of a search that looks like (part of) a phone number.
+    """
+    if PHONE_PATTERN.fullmatch(search.strip()):
+        digits = re.sub(r"\D", "", search)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            return digits
+    return None
+
+
+def text_search_terms(search: str) -> str:
+    """
+    Treats input as plain words: quotes and leading minus signs would
+    otherwise be read as $text phrase and negation operators.
+    """
+    words = search.replace('"', " ").split()
+    return " ".join(word.lstrip("-") for word in words if word.lstrip("-"))
+
+
+def build_search_filter(search: str, mode: SearchMode) -> dict:
+    """
+    Mongo filter for the /messages search box.
+
+    Phone-like input of at least MIN_PHONE_DIGITS digits becomes an anchored
+    prefix match on wa_id (index friendly). Otherwise `text` uses the text
+    index and `substring` does a case-insensitive match of the escaped
+    input, never a user regex.
+    """
+    digits = phone_prefix(search)
+    if digits:
+        return {"wa_id": {"$regex": f"^{digits}"}}
+
+    if mode == "text":
+        terms = text_search_terms(search)
+        return {"$text": {"$search": terms}} if terms else {}
+
+    literal = re.escape(search)
+    return {
+        "$or": [
+            {"text": {"$regex": literal, "$options": "i"}},
+            {"reply_text": {"$regex": literal, "$options": "i"}},
+        ]
+    }
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -21,6 +22,117 @@ class Settings(BaseSettings):
     
     # Mongo
     mongo_uri: str
+    mongo_database: str = "bellerouze_chatbot"
+    mongo_max_pool_size: int = 50
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 60_000
+    mongo_connect_timeout_ms: int = 5_000
+    mongo_server_selection_timeout_ms: int = 5_000
+    mongo_wait_queue_timeout_ms: int = 2_000
+
+    # Webhook ingestion
+    webhook_mode: Literal["inline", "queue"] = "queue"
+    webhook_queue_maxsize: int = 1000
+    webhook_workers: int = 4
+    webhook_overflow: Literal["drop", "reject", "spill"] = "spill"
+    webhook_drain_timeout_seconds: float = 20.0
+
+    # Webhook deduplication
+    dedup_cache_size: int = 10_000
+    dedup_memory_ttl_seconds: float = 24 * 60 * 60
+    dedup_store_ttl_seconds: int = 7 * 24 * 60 * 60  # Meta retries for up to 7 days
+
+    # LLM gateway
+    llm_model: str = "gpt-5-nano"
+    llm_fallback_models: list[str] = []  # e.g. ["openai:gpt-4.1-nano"]
+    llm_deadline_seconds: float = 20.0
+    llm_hedge_delay_seconds: float = 6.0  # 0 disables hedging
+    llm_breaker_failures: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    llm_canned_reply: str = (
+        "Sorry, I can't answer right now. You can reach Bellerouze Outfitters "
+        "on +254 111 056 090, at outfits@bellerouze.com or on "
+        "https://bellerouze.com/. We're open Mon–Fri 6 am – 7 pm and "
+        "Sat–Sun 9 am – 6 pm."
+    )
+
+    # Prompt
+    prompt_timezone: str = "Africa/Nairobi"
+
+    # Knowledge base
+    knowledge_enabled: bool = True
+    knowledge_dir: str | None = None  # .md/.txt files
+    knowledge_collection: str | None = "knowledge"  # {title, text} documents
+    knowledge_refresh_seconds: float = 5 * 60
+    knowledge_chunk_words: int = 120
+    knowledge_top_k: int = 3
+    knowledge_min_score: float = 1.0
+    knowledge_max_tokens: int = 400
+
+    # Reply cache
+    reply_cache_enabled: bool = True
+    reply_cache_size: int = 1000
+    reply_cache_ttl_seconds: float = 6 * 60 * 60
+    reply_cache_similarity: bool = False
+    reply_cache_similarity_threshold: float = 0.9
+
+    # Graph API client
+    graph_base_url: str = "https://graph.facebook.com"
+    graph_http2: bool = False  # needs the h2 package
+    graph_timeout_seconds: float = 10.0
+    graph_connect_timeout_seconds: float = 5.0
+    graph_max_connections: int = 20
+    graph_max_keepalive_connections: int = 10
+    graph_keepalive_expiry_seconds: float = 60.0
+    graph_max_retries: int = 3
+    graph_backoff_base_seconds: float = 0.5
+    graph_max_backoff_seconds: float = 30.0
+    graph_max_concurrency_per_number: int = 10
+
+    # Write-behind buffer
+    write_buffer_enabled: bool = True
+    write_buffer_max_size: int = 200
+    write_buffer_max_latency_seconds: float = 0.5
+    write_buffer_max_retries: int = 3
+    # Beyond this many pending writes, new ones bypass the buffer
+    write_buffer_max_pending: int = 5000
+
+    # Message coalescing
+    coalesce_enabled: bool = True
+    coalesce_window_seconds: float = 1.5
+    coalesce_max_wait_seconds: float = 5.0
+    coalesce_max_fragments: int = 5
+
+    # Conversation memory
+    memory_enabled: bool = True
+    memory_max_conversations: int = 1000
+    memory_max_turns: int = 6
+    memory_max_tokens: int = 800
+    memory_session_ttl_seconds: float = 30 * 60
+
+    # Logging
+    log_json: bool = False
+    log_enqueue: bool = True
+    log_diagnose: bool | None = None  # defaults to on only in dev
+    log_payload_sample_rates: dict[str, float] = {"webhook": 0.05}
+    log_payload_max_chars: int = 2000
+
+    # Multi-worker coordination
+    state_backend: Literal["mongo", "memory"] = "mongo"
+    leader_lease_seconds: float = 30.0
+    graph_max_sends_per_second_per_number: int = 0  # 0 disables the shared limit
+
+    # Debugging
+    stall_detector_enabled: bool = False
+    stall_threshold_seconds: float = 0.1
+
+    # Dashboard
+    messages_count_cache_ttl_seconds: float = 30.0
+    stats_timezone: str = "Africa/Nairobi"
+
+    # Live events
+    events_queue_size: int = 100
+    events_heartbeat_seconds: float = 15.0
 
     client_url: str
 
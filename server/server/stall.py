@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from server.logger import logger
+
+
+class StallDetector:
+    """
+    Logs when the event loop stops turning for longer than `threshold_seconds`.
+
+    A coroutine on the loop bumps a heartbeat every `interval_seconds`; a
+    daemon thread watches it and, when it goes stale, logs the loop thread's
+    current stack, which is the code that is blocking it.
+    """
+
+    def __init__(self, threshold_seconds: float, interval_seconds: float = 0.05):
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: int | None = None
+        self.task: asyncio.Task | None = None
+        self.thread: threading.Thread | None = None
+        self.stopped = threading.Event()
+        self.stalls = 0
+
+    def start(self) -> None:
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self._beat(), name="stall-heartbeat")
+        self.thread = threading.Thread(
+            target=self._watch, name="stall-detector", daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            "Event loop stall detector started ({}ms threshold)",
+            int(self.threshold_seconds * 1000),
+        )
+
+    async def stop(self) -> None:
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+
+    async def _beat(self) -> None:
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval_seconds)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self.stopped.wait(self.interval_seconds):
+            lag = time.monotonic() - self.heartbeat - self.interval_seconds
+            if lag < self.threshold_seconds:
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Report each stall once, while it's happening
+            reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            logger.warning(
+                "🐢 Event loop blocked for {:.0f}ms, loop thread stack:\n{}",
+                lag * 1000,
+                stack,
+            )
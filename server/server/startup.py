@@ -0,0 +1,92 @@
+"""
+Startup timing.
+
+`StartupTimer` logs how long the server took to become ready, split into
+imports and lifespan phases. Running this module measures the cold import
+of `server.main` in a fresh interpreter, per top-level module, and exits
+non-zero when it is over budget:
+
+    python -m server.startup --budget 2.0
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from server import IMPORT_STARTED
+from server.logger import logger
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.lifespan_started = time.perf_counter()
+        self.phases: list[tuple[str, float]] = [
+            ("imports", self.lifespan_started - IMPORT_STARTED)
+        ]
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self) -> None:
+        ready = time.perf_counter() - IMPORT_STARTED
+        breakdown = ", ".join(
+            f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases
+        )
+        logger.info("🚀 Ready in {:.0f}ms ({})", ready * 1000, breakdown)
+
+
+def import_profile(module: str) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Imports `module` in a fresh interpreter with -X importtime and returns
+    the total seconds and the cumulative seconds per top-level import.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    top_level: list[tuple[str, float]] = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        # Nested imports are indented by two spaces per level
+        if match and len(match.group(3)) == 1:
+            top_level.append((match.group(4), int(match.group(2)) / 1_000_000))
+
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return sum(seconds for _, seconds in top_level), top_level
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold import budget check")
+    parser.add_argument("--module", default="server.main")
+    parser.add_argument("--budget", type=float, default=2.0, help="Seconds")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    total, modules = import_profile(args.module)
+    for name, seconds in modules[: args.top]:
+        print(f"{seconds * 1000:9.1f}ms  {name}")
+    print(f"{total * 1000:9.1f}ms  total (budget {args.budget * 1000:.0f}ms)")
+
+    if total > args.budget:
+        print("❌ Cold import is over budget")
+        return 1
+    print("✅ Cold import is within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Protocol
+
+from pymongo import ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+from server.logger import logger
+
+STATE_COLLECTION = "shared_state"
+
+
+class StateBackend(Protocol):
+    """
+    Key/value state shared by every worker process: dedup claims, cached
+    replies, rate-limit counters and leases.
+    """
+
+    async def ensure_indexes(self) -> None: ...
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        """Sets `key` only if it is absent; True if this call set it."""
+        ...
+
+    async def release(self, key: str) -> None: ...
+
+    async def get(self, key: str) -> Any | None: ...
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None: ...
+
+    async def incr(self, key: str, ttl_seconds: float) -> int: ...
+
+    async def acquire_lease(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        """Takes or renews `key` for `owner` unless another owner holds it."""
+        ...
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        """Drops `key` if `owner` still holds it."""
+        ...
+
+
+class MemoryStateBackend:
+    """
+    Single-process backend, for tests and one-worker deployments.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, tuple[float, Any]] = {}
+
+    def _live(self, key: str) -> tuple[float, Any] | None:
+        entry = self.entries.get(key)
+        if entry and entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        return entry
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        if self._live(key):
+            return False
+        self.entries[key] = (time.monotonic() + ttl_seconds, True)
+        return True
+
+    async def release(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        self.entries[key] = (time.monotonic() + ttl_seconds, value)
+
+    async def incr(self, key: str, ttl_seconds: float) -> int:
+        entry = self._live(key)
+        value = (entry[1] if entry else 0) + 1
+        expires_at = entry[0] if entry else time.monotonic() + ttl_seconds
+        self.entries[key] = (expires_at, value)
+        return value
+
+    async def acquire_lease(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        entry = self._live(key)
+        if entry and entry[1] != owner:
+            return False
+        self.entries[key] = (time.monotonic() + ttl_seconds, owner)
+        return True
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        entry = self._live(key)
+        if entry and entry[1] == owner:
+            del self.entries[key]
+
+
+class MongoStateBackend:
+    """
+    Backend on a `shared_state` collection: one document per key, `_id`
+    giving set-if-absent semantics and a TTL index on `expires_at` cleaning
+    up. Reads also check `expires_at`, since the TTL monitor runs once a minute.
+    """
+
+    def __init__(self, database: AsyncDatabase):
+        self.collection = database.get_collection(STATE_COLLECTION)
+
+    @staticmethod
+    def _expiry(ttl_seconds: float) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+
+    @staticmethod
+    def _expired() -> dict:
+        return {"expires_at": {"$lt": datetime.now(timezone.utc)}}
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        try:
+            # Replaces an expired leftover the TTL monitor hasn't removed yet
+            await self.collection.update_one(
+                {"_id": key, **self._expired()},
+                {"$set": {"expires_at": self._expiry(ttl_seconds), "value": True}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self, key: str) -> None:
+        await self.collection.delete_one({"_id": key})
+
+    async def get(self, key: str) -> Any | None:
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gte": datetime.now(timezone.utc)}}
+        )
+        return doc["value"] if doc else None
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": self._expiry(ttl_seconds)}},
+            upsert=True,
+        )
+
+    async def incr(self, key: str, ttl_seconds: float) -> int:
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            {
+                "$inc": {"value": 1},
+                "$setOnInsert": {"expires_at": self._expiry(ttl_seconds)},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["value"]
+
+    async def acquire_lease(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        try:
+            await self.collection.update_one(
+                {"_id": key, "$or": [{"value": owner}, self._expired()]},
+                {"$set": {"value": owner, "expires_at": self._expiry(ttl_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        await self.collection.delete_one({"_id": key, "value": owner})
+
+
+def create_state_backend(kind: str, database: AsyncDatabase) -> StateBackend:
+    if kind == "memory":
+        return MemoryStateBackend()
+    return MongoStateBackend(database)
+
+
+class LeaderElection:
+    """
+    Lease-based leader election so only one worker runs scheduled jobs.
+
+    Each call to `is_leader` takes or renews the lease; the leader keeps it
+    as long as it renews within `lease_seconds`, after which any worker
+    can take over. `stop` gives the lease up on shutdown, so a successor
+    does not have to wait it out.
+    """
+
+    def __init__(self, backend: StateBackend, name: str, lease_seconds: float):
+        self.backend = backend
+        self.key = f"lease:{name}"
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leader = False
+        self.jobs: set[asyncio.Task] = set()
+
+    async def is_leader(self) -> bool:
+        leader = await self.backend.acquire_lease(
+            self.key, self.owner, self.lease_seconds
+        )
+        if leader != self.leader:
+            logger.info(
+                "{} leadership for {}", "Acquired" if leader else "Lost", self.key
+            )
+        self.leader = leader
+        return leader
+
+    def renewer(self):
+        """
+        The scheduler job that keeps the lease, tracked like the leader jobs.
+        """
+        return self._tracked(self.is_leader)
+
+    def run_if_leader(self, job):
+        """
+        Wraps an async job so it only runs on the current leader.
+        """
+
+        async def wrapper():
+            if await self.is_leader():
+                await job()
+
+        wrapper.__name__ = job.__name__
+        return self._tracked(wrapper)
+
+    def _tracked(self, job):
+        async def wrapper():
+            task = asyncio.current_task()
+            self.jobs.add(task)
+            try:
+                await job()
+            finally:
+                self.jobs.discard(task)
+
+        wrapper.__name__ = job.__name__
+        return wrapper
+
+    async def stop(self, timeout: float | None = None) -> None:
+        """
+        Waits for running jobs, cancelling those still running after
+        `timeout`, then releases the lease if this worker holds it.
+        """
+        if self.jobs:
+            _, pending = await asyncio.wait(list(self.jobs), timeout=timeout)
+            if pending:
+                logger.warning(
+                    "⚠️ Cancelling {} scheduler jobs still running", len(pending)
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if self.leader:
+            await self.backend.release_lease(self.key, self.owner)
+            self.leader = False
+            logger.info("Released leadership for {}", self.key)
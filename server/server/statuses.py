@@ -0,0 +1,105 @@
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.schemas import StatusUpdate
+
+# Breaks ties between statuses that share a timestamp
+STATUS_RANK = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+
+def status_summary_update(status_doc: dict) -> list[dict]:
+    """
+    Update pipeline folding one status into `status_summary` on its message.
+
+    Idempotent and order independent: per-status timestamps are set, the
+    latest status is whichever has the highest (timestamp, rank) and errors
+    are merged as a set, so replays and out-of-order deliveries converge.
+    """
+    status = status_doc["status"]
+    timestamp = status_doc["timestamp"]
+    order_key = timestamp * 10 + STATUS_RANK.get(status, 0)
+    current_key = {"$ifNull": ["$status_summary.order_key", -1]}
+
+    return [
+        {
+            "$set": {
+                f"status_summary.timestamps.{status}": str(timestamp),
+                "status_summary.latest": {
+                    "$cond": [
+                        {"$gte": [order_key, current_key]},
+                        status,
+                        "$status_summary.latest",
+                    ]
+                },
+                "status_summary.order_key": {"$max": [order_key, current_key]},
+                "status_summary.recipient_id": status_doc["recipient_id"],
+                "status_summary.display_phone_number": status_doc[
+                    "display_phone_number"
+                ],
+                "status_summary.errors": {
+                    "$setUnion": [
+                        {"$ifNull": ["$status_summary.errors", []]},
+                        status_errors(status_doc),
+                    ]
+                },
+            }
+        }
+    ]
+
+
+def status_errors(status_doc: dict) -> list[dict]:
+    value = status_doc["entry"][0]["changes"][0]["value"]
+    return value["statuses"][0].get("errors", [])
+
+
+def fold_status_operation(status_doc: dict) -> UpdateOne:
+    return UpdateOne(
+        {"reply_id": status_doc["message_id"]}, status_summary_update(status_doc)
+    )
+
+
+async def fold_status(messages: AsyncCollection, status_doc: dict) -> bool:
+    """
+    Applies a stored status to the message it belongs to.
+    Returns False when that message isn't stored yet.
+    """
+    result = await messages.update_one(
+        {"reply_id": status_doc["message_id"]}, status_summary_update(status_doc)
+    )
+    return result.matched_count > 0
+
+
+async def fold_pending_statuses(database: AsyncDatabase, reply_id: str) -> None:
+    """
+    Folds statuses that arrived before their message was inserted.
+    """
+    messages = database.get_collection("messages")
+    async for status_doc in database.get_collection("statuses").find(
+        {"message_id": reply_id}
+    ):
+        await fold_status(messages, status_doc)
+
+
+def parse_status_summary(message_id: str, summary: dict | None) -> list[StatusUpdate]:
+    """
+    Expands a status summary back into the StatusUpdate list the API returns.
+    """
+    if not summary:
+        return []
+
+    errors = summary.get("errors") or None
+    statuses = [
+        StatusUpdate(
+            type="status",
+            timestamp=timestamp,
+            phone_number_id=summary["display_phone_number"],
+            status=status,
+            message_id=message_id,
+            recipient_id=summary["recipient_id"],
+            errors=errors if status == "failed" else None,
+        )
+        for status, timestamp in summary.get("timestamps", {}).items()
+    ]
+    statuses.sort(key=lambda s: (int(s.timestamp), STATUS_RANK.get(s.status, 0)))
+    return statuses
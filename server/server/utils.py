@@ -1,23 +1,105 @@
 import json
+import time
+from dataclasses import dataclass
 from datetime import datetime
-import requests
+
 import httpx
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage
 
-from server.llm import llm
+from server.cache import reply_cache
+from server.gateway import llm_gateway
+from server.graph import graph_client
+from server.knowledge import knowledge_base
+from server.llm import llm_chain
 from server.logger import logger
-from server.prompt import SYSTEM_PROMPT
+from server.metrics import llm_prompt_tokens, llm_tokens
+from server.prompt import prompt_builder
 from server.schemas import IncomingMessage, ReplyMessage, StatusUpdate
 from server.settings import settings
+from server.webhook import iter_events
+
+
+@dataclass(slots=True)
+class GeneratedReply:
+    text: str
+    source: str
+    latency: float = 0.0
+    tokens: int = 0
+    model: str = ""
+    path: str = ""
+    prompt_version: str = ""
+
+
+async def generate_reply(
+    user_message: str,
+    history: list[BaseMessage] | None = None,
+    context: dict[str, str] | None = None,
+) -> GeneratedReply:
+    knowledge = None
+    if settings.knowledge_enabled:
+        knowledge = [chunk.text for chunk in knowledge_base.retrieve(user_message)]
+    prompt = prompt_builder.build(
+        user_message,
+        history,
+        context,
+        knowledge=knowledge,
+        knowledge_version=knowledge_base.version,
+    )
 
+    # Cached answers are context free, so only use them outside a conversation
+    use_cache = settings.reply_cache_enabled and not history and not context
+
+    if use_cache:
+        cached = await reply_cache.get(prompt.cache_key, user_message)
+        if cached is not None:
+            logger.info("⚡ Reply served from cache")
+            return GeneratedReply(
+                text=cached,
+                source="cache",
+                path="cache",
+                prompt_version=prompt.version,
+            )
 
-async def generate_reply(user_message: str) -> str:
-    messages = [
-        SystemMessage(content=SYSTEM_PROMPT),
-        HumanMessage(content=user_message),
-    ]
-    response = await llm.ainvoke(messages)
-    return response.content
+    for section, count in prompt.tokens.items():
+        llm_prompt_tokens.inc(count, section=section, version=prompt.version)
+
+    started = time.perf_counter()
+    result = await llm_gateway.invoke(prompt.messages, llm_chain())
+    latency = time.perf_counter() - started
+
+    if result.response is None:
+        return GeneratedReply(
+            text=settings.llm_canned_reply,
+            source="canned",
+            latency=latency,
+            path=result.path,
+            prompt_version=prompt.version,
+        )
+    response = result.response
+
+    usage = response.usage_metadata or {}
+    llm_tokens.inc(usage.get("input_tokens", 0), kind="input")
+    llm_tokens.inc(usage.get("output_tokens", 0), kind="output")
+
+    if use_cache:
+        await reply_cache.put(
+            prompt.cache_key,
+            user_message,
+            response.content,
+            latency=latency,
+            tokens=usage.get("total_tokens", 0),
+        )
+        logger.debug("Reply cache stats: {}", reply_cache.stats())
+
+    return GeneratedReply(
+        text=response.content,
+        source="llm",
+        latency=latency,
+        tokens=usage.get("total_tokens", 0),
+        model=result.model,
+        path=result.path,
+        prompt_version=prompt.version,
+    )
 
 
 def get_text_message_input(recipient: str, text: str) -> str:
@@ -95,23 +177,11 @@ def get_text_message_input(recipient: str, text: str) -> str:
 
 def parse_whatsapp_webhook(data: dict) -> IncomingMessage | StatusUpdate | None:
     """
-    Extracts useful info from WhatsApp webhook payload.
-    Returns a dictionary for flexibility.
+    First event of a WhatsApp webhook payload, as an API model.
+    Ingestion uses `server.webhook.iter_events` to get all of them.
     """
-    try:
-        entry = data["entry"][0]
-        changes = entry["changes"][0]
-        value = changes["value"]
-
-        if "messages" in value:
-            return parse_incoming_message(data)
-
-        if "statuses" in value:
-            return parse_status(data)
-    except Exception as e:
-        logger.exception(str(e))
-
-        return None
+    event = next(iter_events(data), None)
+    return event.to_model() if event else None
 
 
 def parse_reply_message(raw: dict, reply_text: str = "placeholder") -> ReplyMessage:
@@ -137,79 +207,55 @@ def parse_reply_message(raw: dict, reply_text: str = "placeholder") -> ReplyMess
 
 
 def parse_incoming_message(data: dict) -> IncomingMessage | None:
-    try:
-        entry = data["entry"][0]
-
-        message_id = entry["id"]
-
-        changes = entry["changes"][0]
-        value = changes["value"]
-        metadata = value["metadata"]
-        api_phone_number = metadata["display_phone_number"]
-        api_phone_number_id = metadata["phone_number_id"]
-
-        contact = value["contacts"][0]
-        contact_profile_name = contact["profile"]["name"]
-        sender_contact_number = contact["wa_id"]
-
-        message = value["messages"][0]
-        message_type = message["type"]
+    for event in iter_events(data):
+        if event.type == "message":
+            return event.to_model()
+    return None
 
-        # timestamp = datetime.fromtimestamp(float(message["timestamp"]))
-        timestamp = message["timestamp"]
 
-        if message_type == "text":
-            from_number = message["from"]
-            message_body = message["text"]["body"]
+def parse_status(data: dict) -> StatusUpdate | None:
+    for event in iter_events(data):
+        if event.type == "status":
+            return event.to_model()
+    return None
 
-            return IncomingMessage(
-                type="message",
-                # timestamp=timestamp.strftime("%d/%m/%YT%H:%M:%S"),
-                timestamp=timestamp,
-                phone_number_id=api_phone_number_id,
-                from_number=from_number,
-                incoming_message=message_body,
-            )
-        else:
-            return None
 
-    except Exception as e:
-        logger.exception(str(e))
+def message_query_fields(data: dict, output: dict | None) -> dict:
+    """
+    Top-level copies of the fields the dashboard filters and sorts on,
+    so queries don't have to walk the raw webhook arrays.
+    """
+    value = data["entry"][0]["changes"][0]["value"]
+    message = value["messages"][0]
+    reply = ((output or {}).get("messages") or [{}])[0]
 
-        return None
+    return {
+        "wa_id": value["contacts"][0]["wa_id"],
+        "phone_number_id": value["metadata"]["phone_number_id"],
+        "message_id": message.get("id"),
+        "reply_id": reply.get("id"),
+        "timestamp": int(message["timestamp"]),
+        "direction": "inbound",
+        "text": message.get("text", {}).get("body", ""),
+    }
 
 
-def parse_status(data: dict) -> StatusUpdate | None:
-    try:
-        entry = data["entry"][0]
-        # 746599524843368
-
-        changes = entry["changes"][0]
-        value = changes["value"]
-        metadata = value["metadata"]
-        api_phone_number = metadata["display_phone_number"]
-        api_phone_number_id = metadata["phone_number_id"]
-
-        status = value["statuses"][0]
-        status_id = status["id"]
-        status_value = status["status"]
-
-        # timestamp = datetime.fromtimestamp(float(status["timestamp"]))
-        timestamp = status["timestamp"]
-
-        return StatusUpdate(
-            type="status",
-            # timestamp=timestamp.strftime("%d/%m/%YT%H:%M:%S"),
-            timestamp=timestamp,
-            phone_number_id=api_phone_number,
-            status=status_value,
-            message_id=status_id,
-            recipient_id=status["recipient_id"],
-        )
-    except Exception as e:
-        logger.exception(str(e))
+def status_query_fields(data: dict) -> dict:
+    """
+    Top-level copies of the indexed status fields.
+    """
+    value = data["entry"][0]["changes"][0]["value"]
+    status = value["statuses"][0]
 
-        return None
+    return {
+        "message_id": status["id"],
+        "status": status["status"],
+        "recipient_id": status["recipient_id"],
+        "phone_number_id": value["metadata"]["phone_number_id"],
+        "display_phone_number": value["metadata"]["display_phone_number"],
+        "timestamp": int(status["timestamp"]),
+        "direction": "outbound",
+    }
 
 
 def build_reply_message(to: str, text: str) -> dict:
@@ -228,21 +274,15 @@ async def send_whatsapp_message(phone_number_id: str, payload: dict) -> httpx.Re
     Sends a WhatsApp message via Graph API.
     Returns the raw httpx.Response object.
     """
-    url = f"https://graph.facebook.com/{settings.whatsapp_api_version}/{phone_number_id}/messages"
-    headers = {
-        "Authorization": f"Bearer {settings.whatsapp_access_token}",
-        "Content-Type": "application/json",
-    }
-
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(url, headers=headers, json=payload)
-        print(f"📨 Sent to {url} with status {response.status_code}")
-        return response
+    response = await graph_client.post_message(phone_number_id, payload)
+    logger.info("📨 Sent to {} with status {}", response.url, response.status_code)
+    return response
 
 
-def ping_self():
+async def ping_self():
     try:
-        requests.get(settings.server_url, timeout=5)
-        print("Pinged self ✅")
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            await client.get(settings.server_url)
+        logger.info("Pinged self ✅")
     except Exception as e:
-        print("Ping failed ❌", e)
+        logger.warning("Ping failed ❌ {}", e)
@@ -0,0 +1,153 @@
+import json
+from dataclasses import dataclass
+from typing import Any, ClassVar, Iterator, Literal
+
+from server.logger import logger
+from server.schemas import IncomingMessage, StatusUpdate
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson ships with fastapi[all]
+    orjson = None
+
+
+def decode_json(body: bytes) -> Any:
+    """
+    Decodes a request body, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+@dataclass(slots=True)
+class MessageEvent:
+    """
+    One inbound text message from a webhook delivery.
+
+    `payload` is the delivery narrowed down to this message, in the same
+    shape as a single-message webhook, so it can be stored and re-parsed.
+    """
+
+    type: ClassVar[Literal["message"]] = "message"
+
+    message_id: str | None
+    from_number: str
+    phone_number_id: str
+    display_phone_number: str
+    timestamp: str
+    text: str
+    payload: dict
+    profile_name: str | None = None
+
+    def to_model(self) -> IncomingMessage:
+        return IncomingMessage(
+            type="message",
+            timestamp=self.timestamp,
+            phone_number_id=self.phone_number_id,
+            from_number=self.from_number,
+            incoming_message=self.text,
+            message_id=self.message_id,
+        )
+
+
+@dataclass(slots=True)
+class StatusEvent:
+    """
+    One delivery status from a webhook delivery, `payload` as above.
+    """
+
+    type: ClassVar[Literal["status"]] = "status"
+
+    message_id: str
+    status: str
+    recipient_id: str
+    phone_number_id: str
+    display_phone_number: str
+    timestamp: str
+    errors: list[dict] | None
+    payload: dict
+
+    def to_model(self) -> StatusUpdate:
+        return StatusUpdate(
+            type="status",
+            timestamp=self.timestamp,
+            # The API has always reported the display number here
+            phone_number_id=self.display_phone_number,
+            status=self.status,
+            message_id=self.message_id,
+            recipient_id=self.recipient_id,
+            errors=self.errors,
+        )
+
+
+WebhookEvent = MessageEvent | StatusEvent
+
+_EVENT_FIELDS = ("messages", "statuses", "contacts")
+
+
+def _narrow(data: dict, entry: dict, change: dict, value: dict, **events) -> dict:
+    # Shallow copies: the raw message and status dicts are shared
+    return {
+        **data,
+        "entry": [{**entry, "changes": [{**change, "value": {**value, **events}}]}],
+    }
+
+
+def iter_events(data: dict) -> Iterator[WebhookEvent]:
+    """
+    Yields every text message and status in a webhook delivery, in order.
+
+    Meta may batch several entries, changes, messages or statuses into one
+    delivery. Non-text messages are skipped, and so are malformed items,
+    without losing the rest of the batch.
+    """
+    for entry in data.get("entry") or ():
+        for change in entry.get("changes") or ():
+            value = change.get("value") or {}
+            metadata = value.get("metadata") or {}
+            base = {k: v for k, v in value.items() if k not in _EVENT_FIELDS}
+            contacts = {
+                contact.get("wa_id"): contact for contact in value.get("contacts") or ()
+            }
+
+            for message in value.get("messages") or ():
+                if message.get("type") != "text":
+                    continue
+                try:
+                    from_number = message["from"]
+                    contact = contacts.get(from_number) or {"wa_id": from_number}
+                    yield MessageEvent(
+                        message_id=message.get("id"),
+                        from_number=from_number,
+                        phone_number_id=metadata["phone_number_id"],
+                        display_phone_number=metadata["display_phone_number"],
+                        timestamp=message["timestamp"],
+                        text=message["text"]["body"],
+                        payload=_narrow(
+                            data,
+                            entry,
+                            change,
+                            base,
+                            contacts=[contact],
+                            messages=[message],
+                        ),
+                        profile_name=(contact.get("profile") or {}).get("name"),
+                    )
+                except (KeyError, TypeError) as e:
+                    logger.warning("⚠️ Skipping malformed webhook message: {!r}", e)
+
+            for status in value.get("statuses") or ():
+                try:
+                    yield StatusEvent(
+                        message_id=status["id"],
+                        status=status["status"],
+                        recipient_id=status["recipient_id"],
+                        phone_number_id=metadata["phone_number_id"],
+                        display_phone_number=metadata["display_phone_number"],
+                        timestamp=status["timestamp"],
+                        errors=status.get("errors"),
+                        payload=_narrow(data, entry, change, base, statuses=[status]),
+                    )
+                except (KeyError, TypeError) as e:
+                    logger.warning("⚠️ Skipping malformed webhook status: {!r}", e)
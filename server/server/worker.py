@@ -0,0 +1,178 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Literal
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+from server.logger import logger
+from server.webhook import WebhookEvent, iter_events
+
+SPILL_COLLECTION = "webhook_spill"
+
+
+@dataclass(slots=True)
+class WebhookJob:
+    event: WebhookEvent
+
+
+Handler = Callable[[AsyncDatabase, WebhookEvent], Awaitable[None]]
+
+
+async def spill(database: AsyncDatabase, data: dict) -> None:
+    """
+    Stores a payload for the queue workers to replay, now or on next start.
+    """
+    await database.get_collection(SPILL_COLLECTION).insert_one(
+        {"input": data, "spilled_at": datetime.now(timezone.utc)}
+    )
+
+
+class WebhookQueue:
+    """
+    Bounded in-process queue drained by a fixed pool of worker tasks.
+
+    `submit` never waits: when the queue is full the job is dropped, rejected
+    (so the caller can answer 429 and let Meta retry) or spilled to Mongo and
+    picked back up by idle workers.
+    """
+
+    def __init__(
+        self,
+        database: AsyncDatabase,
+        handler: Handler,
+        maxsize: int,
+        workers: int,
+        overflow: Literal["drop", "reject", "spill"],
+        idle_poll_seconds: float = 1.0,
+    ):
+        self.database = database
+        self.handler = handler
+        self.queue: asyncio.Queue[WebhookJob] = asyncio.Queue(maxsize=maxsize)
+        self.workers = workers
+        self.overflow = overflow
+        self.idle_poll_seconds = idle_poll_seconds
+        self.tasks: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.spilled = 0
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self.tasks.append(
+                asyncio.create_task(self._run(i), name=f"webhook-worker-{i}")
+            )
+        logger.info("Started {} webhook workers", self.workers)
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Waits for queued jobs to finish, then cancels the workers.
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "⚠️ Webhook queue drain timed out with {} jobs left", self.queue.qsize()
+            )
+            await self._spill_remaining()
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        logger.info("Stopped webhook workers")
+
+    async def submit(self, job: WebhookJob) -> bool:
+        """
+        Returns False only when the job was rejected and should be retried by the sender.
+        """
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow == "reject":
+            self.rejected += 1
+            return False
+
+        if self.overflow == "spill":
+            await self._spill(job.event.payload)
+            self.spilled += 1
+            return True
+
+        self.dropped += 1
+        logger.warning("⚠️ Webhook queue full, dropping job")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "spilled": self.spilled,
+        }
+
+    async def _run(self, index: int) -> None:
+        # One worker replays payloads spilled at the last shutdown, then keeps
+        # picking up ones spilled under load when overflow is "spill"
+        if index == 0:
+            await self._unspill()
+        while True:
+            try:
+                job = await asyncio.wait_for(
+                    self.queue.get(), timeout=self.idle_poll_seconds
+                )
+            except asyncio.TimeoutError:
+                if index == 0 and self.overflow == "spill":
+                    await self._unspill()
+                continue
+
+            self.in_flight += 1
+            try:
+                await self.handler(self.database, job.event)
+            except Exception as e:
+                logger.exception(f"❌ Error processing webhook: {str(e)}")
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    async def _spill(self, data: dict) -> None:
+        await spill(self.database, data)
+
+    async def _spill_remaining(self) -> None:
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            try:
+                await self._spill(job.event.payload)
+            finally:
+                self.queue.task_done()
+
+    async def _unspill(self) -> None:
+        """
+        Moves spilled payloads back onto the queue while there is room.
+
+        Errors are logged rather than raised, so the worker calling this
+        keeps running.
+        """
+        collection = self.database.get_collection(SPILL_COLLECTION)
+        try:
+            while not self.queue.full():
+                doc = await collection.find_one_and_delete(
+                    {}, sort=[("spilled_at", 1)]
+                )
+                if doc is None:
+                    return
+
+                for event in iter_events(doc["input"]):
+                    # Spills are single events, except ones from older versions
+                    if self.queue.full():
+                        await self._spill(event.payload)
+                    else:
+                        self.queue.put_nowait(WebhookJob(event=event))
+        except Exception as e:
+            logger.exception("❌ Error replaying spilled webhooks: {!r}", e)